@@ -0,0 +1,31 @@
+"""Lightweight stand-ins for the discord objects events are dispatched with,
+so that benchmarks run offline, without a token or a gateway.  They are the
+objects recordings are replayed with (see `recording.py`)."""
+
+import discord
+
+from Feynbot.recording import ReplayChannel as FakeChannel
+from Feynbot.recording import ReplayGuild as FakeGuild
+from Feynbot.recording import ReplayMessage as FakeMessage
+from Feynbot.recording import ReplayUser as FakeUser
+
+__all__ = ["FakeBot", "FakeChannel", "FakeGuild", "FakeMessage", "FakeUser"]
+
+
+class FakeBot(discord.Client):
+    """A client that is never logged in, with what the handler and the
+    listeners under `events/` expect of `Feynbot`."""
+
+    def __init__(self) -> None:
+        super().__init__(intents=discord.Intents.all())
+        self.name = "Feynbot"
+        self.console = None
+
+    def log(self, *_, **__) -> None:
+        pass
+
+    def warning(self, *_, **__) -> None:
+        pass
+
+    def error(self, *_, **__) -> None:
+        pass
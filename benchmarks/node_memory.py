@@ -0,0 +1,117 @@
+"""Measures the memory and construction time of event and command trees, per
+listener.  Every listener is scoped to its own guild, like per-guild overrides
+generated for many guilds.
+
+With `--baseline`, the same trees are first built with the package as of a git
+ref (e.g. the commit before a change), extracted to a temporary directory, so
+both are measured on the same machine.
+
+Run from the same directory as `run.py`:
+    python benchmarks/node_memory.py [listeners] [trees] [--baseline REF]"""
+
+import argparse
+import gc
+import io
+import os
+import pathlib
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from Feynbot.commands import CommandTree
+from Feynbot.events import EventTree
+
+
+def listener(**_) -> None:
+    pass
+
+
+def build_event_trees(listeners: int, trees: int) -> EventTree:
+    root = EventTree("Root")
+    per_tree = listeners // trees
+    for i in range(trees):
+        tree = EventTree(f"Tree{i}")
+        for j in range(per_tree):
+            gid = i * per_tree + j
+            tree.bind("on_message", f"Listener{gid}", oid=gid + 1)(listener)
+        tree.parent_to(root, inherit=False)
+    root.compile()
+    return root
+
+
+def build_command_trees(listeners: int, trees: int) -> CommandTree:
+    root = CommandTree("Root")
+    per_tree = listeners // trees
+    for i in range(trees):
+        tree = CommandTree(f"Tree{i}")
+        for j in range(per_tree):
+            gid = i * per_tree + j
+            tree.bind("ping", f"Ping{gid}", gid=gid + 1)(listener)
+        tree.parent_to(root, inherit=False)
+    return root
+
+
+def measure(build: Callable[[int, int], object], listeners: int, trees: int) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    root = build(listeners, trees)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Timed again without tracing, which slows allocation down.
+    del root
+    gc.collect()
+    start = time.perf_counter()
+    root = build(listeners, trees)
+    untraced = time.perf_counter() - start
+    print(
+        f"{build.__name__:<20} {size / listeners:>10.0f} B/listener "
+        f"{untraced / listeners * 1e6:>8.1f} µs/listener "
+        f"({elapsed / listeners * 1e6:.1f} µs traced)"
+    )
+
+
+def measure_baseline(ref: str, listeners: int, trees: int) -> None:
+    """Run this script again, with the package as of `ref`."""
+    repository = pathlib.Path(__file__).resolve().parent.parent
+    archive = subprocess.run(
+        ["git", "-C", str(repository), "archive", ref, "feynbot"],
+        check=True,
+        capture_output=True,
+    ).stdout
+    with tempfile.TemporaryDirectory() as directory:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(directory)
+        os.rename(
+            os.path.join(directory, "feynbot"), os.path.join(directory, "Feynbot")
+        )
+        path = os.environ.get("PYTHONPATH")
+        environment = dict(
+            os.environ,
+            PYTHONPATH=directory if not path else os.pathsep.join((directory, path)),
+        )
+        subprocess.run(
+            [sys.executable, __file__, str(listeners), str(trees)],
+            check=True,
+            env=environment,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("listeners", type=int, nargs="?", default=10000)
+    parser.add_argument("trees", type=int, nargs="?", default=10)
+    parser.add_argument("--baseline", help="a git ref to measure first")
+    arguments = parser.parse_args()
+    if arguments.baseline:
+        print(f"Baseline ({arguments.baseline}):")
+        measure_baseline(arguments.baseline, arguments.listeners, arguments.trees)
+        print("Current:")
+    print(f"{arguments.listeners} listeners in {arguments.trees} trees")
+    measure(build_event_trees, arguments.listeners, arguments.trees)
+    measure(build_command_trees, arguments.listeners, arguments.trees)
@@ -0,0 +1,42 @@
+"""Replays a recording of production traffic (see `recording.py`) through the
+listeners under `events/`, without a gateway connection, and reports which
+listeners took the most time.
+
+Record with the `record` option of the bot, e.g.
+`"record": {"path": "traffic.jsonl.gz", "anonymise": true}`, then run from the
+same directory as `run.py`:
+    python benchmarks/replay.py traffic.jsonl.gz [--speed 10 | --max]"""
+
+import argparse
+import asyncio
+import tempfile
+
+from Feynbot import instrumentation
+from Feynbot.handler import Handler
+from Feynbot.recording import replay
+
+from fakes import FakeBot
+
+
+async def main(options: argparse.Namespace) -> None:
+    instrumentation.configure(enabled=True, slow_threshold=options.slow)
+    with tempfile.TemporaryDirectory() as commands_directory:
+        # Commands aren't dispatched as events, so they aren't loaded.
+        handler = Handler(FakeBot(), options.events, commands_directory)
+        speed = None if options.max else options.speed
+        results = await replay(handler, options.recording, speed)
+        await handler.db.close()
+    for metric, value in results.items():
+        print(f"{metric:<20} {value:>12,.3f}")
+    print(instrumentation.summarize(options.top))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording")
+    parser.add_argument("--events", default="events")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--max", action="store_true", help="as fast as possible")
+    parser.add_argument("--slow", type=float, default=0.1, help="slow call seconds")
+    parser.add_argument("--top", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -1,3 +1,4 @@
+from Feynbot import instrumentation
 from Feynbot.commands import CommandTree
 
 tree = CommandTree("DebugCommands")
@@ -6,3 +7,10 @@ tree = CommandTree("DebugCommands")
 @tree.bind("ping", "Ping", description="Pong!")
 def ping(bot, **_):
     bot.log("Pong!")
+
+
+@tree.bind("listeners", "ListenerStats", description="The slowest listeners.")
+async def listener_stats(context, **_):
+    summary = instrumentation.summarize()
+    # Discord messages are limited to 2000 characters.
+    await context.reply(f"```\n{summary[:1990]}\n```", ephemeral=True)
@@ -4,7 +4,8 @@ tree = EventTree("CommandHandling", persistent=True, priority=75)
 
 
 @tree.bind("on_guild_available", "SyncGuildCommands")
-async def log_ready(bot, **_) -> None:
-    bot.log("Syncing guild commands...")
-    await bot.sync_commands()
-    bot.log("Guild commands synced.")
+async def log_ready(bot, guild, **_) -> None:
+    # Only scopes whose commands changed since the last sync are synced.
+    synced = await bot.sync_commands(None, guild)
+    if synced:
+        bot.log(f"Commands synced for {len(synced)} scope(s).")
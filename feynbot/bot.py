@@ -1,8 +1,10 @@
 """Contains the Feynbot class and relevant high-level methods."""
 
 # System
+import asyncio
 import os
 import inspect
+from typing import Any, Optional
 
 # Application
 import discord
@@ -11,7 +13,12 @@ from rich.console import Console
 from rich.traceback import install
 
 # Local
+from Feynbot import executors, instrumentation, logs
+from Feynbot.cluster import ClusterClient
+from Feynbot.data_interface import Interface, create_interface
 from Feynbot.handler import Handler
+from Feynbot.members import get_cache_flags
+from Feynbot.outbound import NORMAL, Outbox
 
 # Setup
 install()
@@ -27,6 +34,45 @@ class Feynbot(discord.Client, Handler):
         self.prefix = kwargs.pop("prefix", ">")
         self.events_directory: str = kwargs.pop("events_directory")
         self.commands_directory: str = kwargs.pop("commands_directory")
+        self.dispatch_queues: Optional[dict] = kwargs.pop("dispatch_queues", None)
+        self.manifest_path: Optional[str] = kwargs.pop("manifest", None)
+        self.warm_up_delay: float = kwargs.pop("warm_up_delay", 10)
+        self.command_hashes: Optional[str] = kwargs.pop(
+            "command_hashes", "command_hashes.json"
+        )
+        self.db: Interface = create_interface(**kwargs.pop("database", {}))
+        self.settings_options: Optional[dict] = kwargs.pop("settings", None)
+        # Compact messages for edits and deletes (see `message_cache.py`), rather
+        # than raising `max_messages`; `None` to disable it.
+        self.message_cache_options: Optional[dict] = kwargs.pop("message_cache", {})
+        # Members are chunked lazily (see `members.py`), rather than every
+        # guild's before `on_ready`; `None` to leave it to `discord.py`.
+        self.member_options: Optional[dict] = kwargs.pop("members", {})
+        # Text commands with `prefix` (see `message_commands.py`); off unless set
+        self.message_command_options: Optional[dict] = kwargs.pop(
+            "message_commands", None
+        )
+        if self.message_command_options is not None:
+            self.message_command_options.setdefault("prefix", self.prefix)
+        self.recording: Optional[dict] = kwargs.pop("record", None)
+        self.outbox = Outbox(**kwargs.pop("outbound", {}))
+        # Set when run by the cluster launcher (see `cluster.py`)
+        cluster_options: Optional[dict] = kwargs.pop("cluster", None)
+        self.cluster: Optional[ClusterClient] = None
+        if cluster_options:
+            self.cluster = ClusterClient(self, **cluster_options)
+        # Before loading, so that listeners are compiled with timing if enabled
+        instrumentation_options: dict = kwargs.pop("instrumentation", {})
+        self.metrics_path: Optional[str] = instrumentation_options.pop("path", None)
+        self.metrics_interval: float = instrumentation_options.pop("interval", 15.0)
+        self.metrics_task: Optional[asyncio.Task] = None
+        instrumentation.configure(**instrumentation_options)
+        executors.configure(
+            thread_workers=kwargs.pop("thread_workers", None),
+            thread_queue=kwargs.pop("thread_queue", None),
+            process_workers=kwargs.pop("process_workers", None),
+            process_queue=kwargs.pop("process_queue", None),
+        )
         self.token = token
         kwargs["max_messages"] = kwargs.get("max_messages", 1000)
         kwargs["intents"] = kwargs.get("intents", {})
@@ -42,15 +88,40 @@ class Feynbot(discord.Client, Handler):
 
         # Set Up Console
         self.console = Console()
-        os.system("cls" if os.name == "nt" else "clear")
+        # Clusters share the launcher's terminal.
+        if self.cluster is None:
+            os.system("cls" if os.name == "nt" else "clear")
         self.print = self.console.print
-        self.log = self.console.log
+        # Records are written in batches on a thread (see `logs.py`).
+        self.logger = logs.create_logger(self.console, **kwargs.pop("logging", {}))
+        self.log = self.logger.log
         self.print("[bold green]Feynbot is starting...[/bold green]")
 
         # Pass to super
         kwargs["intents"] = discord.Intents(**kwargs["intents"])
-        discord.Client.__init__(self, **kwargs)
-        Handler.__init__(self, self, self.events_directory, self.commands_directory)
+        if self.member_options is not None:
+            kwargs["chunk_guilds_at_startup"] = False
+            kwargs["member_cache_flags"] = get_cache_flags(
+                kwargs["intents"], self.member_options.pop("cache", None)
+            )
+        # `discord.AutoShardedClient`, for `ShardedFeynbot`
+        super(Feynbot, self).__init__(**kwargs)
+        Handler.__init__(
+            self,
+            self,
+            self.events_directory,
+            self.commands_directory,
+            dispatch_queues=self.dispatch_queues,
+            manifest=self.manifest_path,
+            command_hashes=self.command_hashes,
+            database=self.db,
+            settings=self.settings_options,
+            message_cache=self.message_cache_options,
+            members=self.member_options,
+            message_commands=self.message_command_options,
+        )
+        if self.recording:
+            self.start_recording(**self.recording)
 
     # Async Methods
     def addTask(self, coro) -> None:
@@ -66,20 +137,98 @@ class Feynbot(discord.Client, Handler):
             return await function(*args, **kwargs)
         return function(*args, **kwargs)
 
+    async def offload(self, function, *args, process: bool = False, **kwargs):
+        """Run a blocking function on the thread pool, or with `process=True`,
+        a CPU-heavy one on the process pool (arguments must be picklable)."""
+        pool = executors.process_pool if process else executors.thread_pool
+        return await pool.run(function, *args, **kwargs)
+
+    def send(
+        self,
+        destination: discord.abc.Messageable,
+        content: Optional[str] = None,
+        priority: int = NORMAL,
+        coalesce: bool = True,
+        **kwargs,
+    ) -> asyncio.Future:
+        """Queue a message to a channel (see `outbound.py`), rather than
+        sending it directly.  Returns a future of the sent message."""
+        return self.outbox.send(destination, content, priority, coalesce, **kwargs)
+
+    async def respond(
+        self, interaction: discord.Interaction, content: Optional[str] = None, **kwargs
+    ):
+        """Respond to an interaction, without waiting behind queued messages."""
+        return await self.outbox.respond(interaction, content, **kwargs)
+
+    def component_metrics(self) -> dict[str, Optional[dict[str, Any]]]:
+        """The metrics of the optional components, None if disabled.  Shared
+        by the cluster's metrics and the Prometheus export."""
+        return {
+            "outbound": self.outbox.metrics(),
+            "message_cache": (
+                self.message_cache.metrics() if self.message_cache is not None else None
+            ),
+            "members": self.chunker.metrics() if self.chunker else None,
+            "message_commands": (
+                self.message_router.metrics() if self.message_router else None
+            ),
+        }
+
     # Logging
     def error(self, message: str, stack_offset: int = 2):
-        self.log(f"[bold red]ERROR: {message}[/bold red]", _stack_offset=stack_offset)
+        self.logger.log(message, logs.ERROR, stack_offset)
 
     def warning(self, message: str, stack_offset: int = 2):
-        self.log(
-            f"[bold orange]WARNING: {message}[/bold orange]", _stack_offset=stack_offset
-        )
+        self.logger.log(message, logs.WARNING, stack_offset)
+
+    async def sync_commands(
+        self, *guilds: Optional[discord.Object], force: bool = False
+    ) -> list[Optional[discord.Object]]:
+        # Global commands are synced by the first cluster only.
+        if self.cluster is not None and self.cluster.index != 0:
+            guilds = tuple(guild for guild in guilds if guild is not None)
+            if not guilds:
+                return []
+        return await Handler.sync_commands(self, *guilds, force=force)
 
     # Methods
     def to_ids(self, *args) -> list[int]:
         return [arg.id for arg in args]
 
     # Overrides
+    async def setup_hook(self) -> None:
+        if self.cluster is not None:
+            await self.cluster.connect()
+        # Import whatever was registered lazily from the manifest.
+        if self.manifest_path:
+            self.addTask(self.warm_up(self.warm_up_delay))
+        # Export listener metrics for Prometheus (see `instrumentation.py`).
+        if self.metrics_path:
+            self.metrics_task = self.loop.create_task(
+                instrumentation.export(
+                    self.metrics_path, self.metrics_interval, self.component_metrics
+                )
+            )
+
+    async def close(self) -> None:
+        await super().close()
+        await self.close_coalescers()
+        self.scheduler.stop()
+        self.stop_recording()
+        self.outbox.close()
+        if self.chunker is not None:
+            self.chunker.close()
+        if self.message_router is not None:
+            self.message_router.close()
+        if self.cluster is not None:
+            await self.cluster.close()
+        if self.metrics_task is not None:
+            self.metrics_task.cancel()
+        await self.db.close()
+        executors.shutdown()
+        self.logger.close()
+
     def run(self, *args, reconnect: bool = True, **kwargs) -> None:
         super().run(
             self.token,
@@ -88,3 +237,9 @@ class Feynbot(discord.Client, Handler):
             log_handler=kwargs.get("log_handler", None),
             **kwargs,
         )
+
+
+class ShardedFeynbot(Feynbot, discord.AutoShardedClient):
+    """Feynbot on `discord.AutoShardedClient`, running every shard (or those in
+    `shard_ids`) in one process.  To use more than one process, see
+    `cluster.py`."""
@@ -0,0 +1,443 @@
+"""Running the bot as a cluster of processes, each owning a contiguous range of
+shards, so that guilds are spread over more than one core.
+
+The launcher starts one process per cluster with the same configuration.  The
+first cluster is started alone and writes the manifest (see `manifest.py`), so
+that the others register every file from it without importing anything, and
+each cluster after it is started once the one before is connected, to respect
+the gateway's identify rate limit.
+
+Clusters talk through the launcher over a local socket, with JSON lines.  A
+cluster can query one or every cluster (itself included) by name, e.g. for
+the metrics of the whole bot, or for the cluster that has a guild."""
+
+import asyncio
+import inspect
+import json
+import multiprocessing
+import pathlib
+import secrets
+import time
+from typing import Any, Callable, Optional
+
+import aiohttp
+import discord
+
+# Messages are single lines, but metrics of many guilds can be long.
+line_limit = 16 * 1024 * 1024
+
+
+def send(writer: asyncio.StreamWriter, message: dict[str, Any]) -> None:
+    writer.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+
+
+async def get_gateway_info(token: str) -> dict[str, Any]:
+    """Get the recommended shard count and the identify rate limit."""
+    headers = {"Authorization": f"Bot {token}"}
+    url = f"{discord.http.Route.BASE}/gateway/bot"
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers=headers) as response:
+            if response.status != 200:
+                raise ValueError(
+                    f"Getting the gateway information failed with status "
+                    f"{response.status}: {await response.text()}"
+                )
+            return await response.json()
+
+
+def split_shards(shard_count: int, clusters: int) -> list[list[int]]:
+    """Split shards into contiguous ranges, as even as possible."""
+    if clusters > shard_count:
+        raise ValueError(
+            f"Cannot split {shard_count} shard(s) into {clusters} clusters."
+        )
+    size, remainder = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for index in range(clusters):
+        end = start + size + (1 if index < remainder else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def aggregate(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """Sum the integer metrics of every cluster.  Rates, times and other
+    floats can't be summed, and are only reported per cluster."""
+    total: dict[str, Any] = {}
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, dict):
+                total[key] = aggregate([total.get(key, {}), value])
+            elif isinstance(value, int) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+class ClusterHub:
+    """The launcher's end, relaying queries between clusters."""
+
+    def __init__(self, key: str, timeout: float = 10.0) -> None:
+        self.key = key
+        self.timeout = timeout
+        self.address: Optional[tuple[str, int]] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writers: dict[int, asyncio.StreamWriter] = {}
+        self.connected: dict[int, asyncio.Event] = {}
+        self.pending: dict[int, asyncio.Future] = {}
+        self.last_id: int = 0
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self.handle, "127.0.0.1", 0, limit=line_limit
+        )
+        self.address = self.server.sockets[0].getsockname()[:2]
+
+    def get_connected(self, index: int) -> asyncio.Event:
+        event = self.connected.get(index)
+        if event is None:
+            event = self.connected[index] = asyncio.Event()
+        return event
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        hello = json.loads(await reader.readline() or b"{}")
+        # Only processes started by the launcher know the key.
+        if hello.get("op") != "hello" or not secrets.compare_digest(
+            str(hello.get("key")), self.key
+        ):
+            writer.close()
+            return
+        index = hello["cluster"]
+        self.writers[index] = writer
+        self.get_connected(index).set()
+        tasks: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["op"] == "request":
+                    task = asyncio.create_task(self.relay(writer, message))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif message["op"] == "response":
+                    future = self.pending.pop(message["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        except ConnectionError:
+            # The cluster's process died; it's restarted by the launcher.
+            pass
+        finally:
+            if self.writers.get(index) is writer:
+                del self.writers[index]
+                self.get_connected(index).clear()
+            writer.close()
+
+    async def relay(
+        self, writer: asyncio.StreamWriter, message: dict[str, Any]
+    ) -> None:
+        results = await self.query(
+            message["name"], *message["args"], target=message.get("target")
+        )
+        send(writer, {"op": "response", "id": message["id"], "results": results})
+
+    async def query(
+        self, name: str, *args: Any, target: Optional[int] = None
+    ) -> list[dict[str, Any]]:
+        """Query one cluster, or every connected cluster."""
+        targets = sorted(self.writers) if target is None else [target]
+        return list(
+            await asyncio.gather(
+                *(self.query_one(index, name, args) for index in targets)
+            )
+        )
+
+    async def query_one(
+        self, index: int, name: str, args: tuple[Any, ...]
+    ) -> dict[str, Any]:
+        writer = self.writers.get(index)
+        if writer is None:
+            return {"cluster": index, "error": "Not connected."}
+        self.last_id += 1
+        request_id = self.last_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        send(writer, {"op": "request", "id": request_id, "name": name, "args": args})
+        try:
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            return {"cluster": index, "error": "Timed out."}
+        if "error" in response:
+            return {"cluster": index, "error": response["error"]}
+        return {"cluster": index, "result": response["result"]}
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+        for writer in self.writers.values():
+            writer.close()
+
+
+class ClusterClient:
+    """A cluster's end, answering and sending queries.  Handlers are called
+    with the query's arguments, and must return something JSON can encode."""
+
+    def __init__(
+        self,
+        bot: Any,
+        index: int,
+        count: int,
+        address: tuple[str, int],
+        key: str,
+        timeout: float = 15.0,
+    ) -> None:
+        self.bot = bot
+        self.index = index
+        self.count = count
+        self.address = address
+        self.key = key
+        self.timeout = timeout
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.listener: Optional[asyncio.Task] = None
+        self.tasks: set[asyncio.Task] = set()
+        self.pending: dict[int, asyncio.Future] = {}
+        self.last_id: int = 0
+        self.handlers: dict[str, Callable[..., Any]] = {
+            "metrics": self.get_metrics,
+            "has_guild": lambda gid: self.bot.get_guild(gid) is not None,
+            "guild_count": lambda: len(self.bot.guilds),
+        }
+
+    def handler(self, name: Optional[str] = None) -> Callable[[Callable], Callable]:
+        def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+            self.handlers[name or function.__name__] = function
+            return function
+
+        return decorator
+
+    async def connect(self) -> None:
+        reader, self.writer = await asyncio.open_connection(
+            *self.address, limit=line_limit
+        )
+        send(self.writer, {"op": "hello", "cluster": self.index, "key": self.key})
+        self.listener = asyncio.get_running_loop().create_task(self.listen(reader))
+
+    async def listen(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["op"] == "request":
+                    task = asyncio.get_running_loop().create_task(self.answer(message))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                elif message["op"] == "response":
+                    future = self.pending.pop(message["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(message["results"])
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Lost the cluster launcher."))
+            self.pending.clear()
+
+    async def answer(self, message: dict[str, Any]) -> None:
+        response: dict[str, Any] = {"op": "response", "id": message["id"]}
+        handler = self.handlers.get(message["name"])
+        try:
+            if handler is None:
+                raise ValueError(f"`{message['name']}` is not a cluster query.")
+            result = handler(*message["args"])
+            if inspect.isawaitable(result):
+                result = await result
+            response["result"] = result
+        except Exception as exception:
+            response["error"] = f"{type(exception).__name__}: {exception}"
+        if self.writer is not None:
+            send(self.writer, response)
+
+    async def query(
+        self, name: str, *args: Any, target: Optional[int] = None
+    ) -> list[dict[str, Any]]:
+        """Query one cluster, or every cluster (`target=None`), including this
+        one.  Returns a `{"cluster", "result" or "error"}` dict per cluster."""
+        if self.writer is None:
+            raise ConnectionError("Not connected to the cluster launcher.")
+        self.last_id += 1
+        request_id = self.last_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        message = {
+            "op": "request",
+            "id": request_id,
+            "name": name,
+            "args": args,
+            "target": target,
+        }
+        send(self.writer, message)
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def find_guild(self, gid: int) -> Optional[int]:
+        """Get the cluster that has a guild, if any does."""
+        for response in await self.query("has_guild", gid):
+            if response.get("result"):
+                return response["cluster"]
+        return None
+
+    def get_metrics(self) -> dict[str, Any]:
+        bot = self.bot
+        return {
+            "shards": list(bot.shard_ids or ()),
+            "guilds": len(bot.guilds),
+            "latency": bot.latency,
+            "scheduler": bot.scheduler.metrics(),
+            "settings": bot.settings.metrics(),
+            "database": bot.db.metrics(),
+            **bot.component_metrics(),
+        }
+
+    async def metrics(self) -> dict[str, Any]:
+        """The metrics of every cluster, and their integer metrics summed."""
+        responses = await self.query("metrics")
+        results = [response["result"] for response in responses if "result" in response]
+        return {"total": aggregate(results), "clusters": responses}
+
+    async def close(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def run_cluster(
+    config: dict[str, Any],
+    index: int,
+    count: int,
+    shard_ids: list[int],
+    shard_count: int,
+    address: tuple[str, int],
+    key: str,
+) -> None:
+    """The entry point of a cluster's process."""
+    from Feynbot.bot import ShardedFeynbot
+
+    config = dict(config)
+    config["shard_ids"] = shard_ids
+    config["shard_count"] = shard_count
+    config["cluster"] = {"index": index, "count": count, "address": address, "key": key}
+    config["name"] = f"{config.get('name', 'Feynbot')} #{index}"
+    # Each cluster syncs only its own guilds' commands, so hashes are separate.
+    hashes = config.get("command_hashes", "command_hashes.json")
+    if hashes:
+        path = pathlib.Path(hashes)
+        config["command_hashes"] = str(
+            path.with_name(f"{path.stem}.cluster{index}{path.suffix}")
+        )
+    ShardedFeynbot(**config).run()
+
+
+class Launcher:
+    """Starts a process per cluster, and restarts any that crash."""
+
+    def __init__(
+        self,
+        config: dict[str, Any],
+        clusters: int,
+        shard_count: Optional[int] = None,
+        restart_delay: float = 5.0,
+    ) -> None:
+        self.config = config
+        self.clusters = clusters
+        self.shard_count = shard_count
+        self.restart_delay = restart_delay
+        self.key = secrets.token_hex(16)
+        self.hub = ClusterHub(self.key)
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: dict[int, multiprocessing.process.BaseProcess] = {}
+        self.shards: list[list[int]] = []
+        self.identify_delay: float = 5.0
+
+    async def start(self) -> None:
+        gateway = await get_gateway_info(self.config["token"])
+        shard_count = self.shard_count or gateway["shards"]
+        # Shards identify one at a time per bucket, every 5 seconds.
+        limit = gateway.get("session_start_limit", {})
+        self.identify_delay = 5.0 / limit.get("max_concurrency", 1)
+        self.shards = split_shards(shard_count, self.clusters)
+        await self.hub.start()
+        for index in range(self.clusters):
+            self.spawn(index)
+            # Started one after another, so that the first writes the manifest
+            # and identifies don't overlap.
+            await self.wait_connected(index)
+            await asyncio.sleep(self.identify_delay * len(self.shards[index]))
+
+    async def wait_connected(self, index: int) -> None:
+        connected = self.hub.get_connected(index)
+        process = self.processes[index]
+        while not connected.is_set():
+            if not process.is_alive():
+                raise RuntimeError(
+                    f"Cluster {index} exited with code {process.exitcode} while "
+                    f"starting."
+                )
+            try:
+                await asyncio.wait_for(connected.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+
+    def spawn(self, index: int) -> None:
+        process = self.context.Process(
+            target=run_cluster,
+            args=(
+                self.config,
+                index,
+                self.clusters,
+                self.shards[index],
+                sum(len(shards) for shards in self.shards),
+                self.hub.address,
+                self.key,
+            ),
+            name=f"Cluster{index}",
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def watch(self) -> None:
+        """Restart clusters that exit with an error, until every cluster has
+        exited cleanly."""
+        restarts: dict[int, float] = {}
+        while self.processes:
+            await asyncio.sleep(1)
+            for index, process in tuple(self.processes.items()):
+                if process.is_alive():
+                    continue
+                if process.exitcode == 0:
+                    del self.processes[index]
+                    continue
+                # Not restarted faster than `restart_delay`, if crashing on start.
+                if time.monotonic() - restarts.get(index, 0) < self.restart_delay:
+                    continue
+                restarts[index] = time.monotonic()
+                self.spawn(index)
+
+    async def run(self) -> None:
+        try:
+            await self.start()
+            await self.watch()
+        finally:
+            self.hub.close()
+            for process in self.processes.values():
+                process.join()
+
+
+def launch(
+    config: dict[str, Any], clusters: int, shard_count: Optional[int] = None
+) -> None:
+    """Run the bot as `clusters` processes.  Must be called from under
+    `if __name__ == "__main__":`, as each process imports the main module."""
+    asyncio.run(Launcher(config, clusters, shard_count).run())
@@ -0,0 +1,120 @@
+"""Coalescing of bursty events, such as presence, typing, or member updates,
+where only the latest state for some key matters.  An event bound with
+`coalesce=key` is held for `window` seconds after the first call for a key,
+and then called once with the latest state (or every state, with `batch`).
+
+Held calls are delivered early by `flush_all`, which the handler calls before
+detaching reloaded events and on closing, so that none are dropped.  Errors
+go to the handler's error handler (see `configure`), like any listener's."""
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# Called with the event name, within the `except` block of a failed call
+error_handler: Optional[Callable[..., Awaitable[None]]] = None
+
+
+def configure(on_error: Optional[Callable[..., Awaitable[None]]] = None) -> None:
+    global error_handler
+    error_handler = on_error
+
+
+class Coalescer:
+    """Merges calls with the same key into one call per window."""
+
+    def __init__(
+        self,
+        key: Callable[..., Hashable],
+        window: float = 1.0,
+        batch: bool = False,
+        max_batch: int = 1000,
+    ) -> None:
+        # Set by `bind`, once the event's function is known.
+        self.function: Optional[Callable[..., Any]] = None
+        self.is_coroutine: bool = False
+        self.event_name: Optional[str] = None
+        self.key = key
+        self.window = window
+        self.batch = batch
+        self.max_batch = max_batch
+        self.pending: dict[Hashable, deque] = {}
+        self.timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self.tasks: set[asyncio.Task] = set()
+        # Metrics
+        self.received: int = 0
+        self.delivered: int = 0
+
+    def bind(
+        self,
+        function: Callable[..., Any],
+        is_coroutine: bool,
+        event_name: Optional[str] = None,
+    ) -> None:
+        self.function = function
+        self.is_coroutine = is_coroutine
+        self.event_name = event_name
+
+    def submit(self, *args: Any, **kwargs: Any) -> None:
+        self.received += 1
+        key = self.key(*args, **kwargs)
+        states = self.pending.get(key)
+        if states is None:
+            states = deque(maxlen=self.max_batch if self.batch else 1)
+            self.pending[key] = states
+            loop = asyncio.get_running_loop()
+            self.timers[key] = loop.call_later(self.window, self.flush, key)
+        states.append((args, kwargs))
+
+    def flush(self, key: Hashable) -> None:
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        states = self.pending.pop(key, None)
+        if not states:
+            return
+        args, kwargs = states[-1]
+        if self.batch:
+            # The latest context carries every context of the window.
+            args[0].batch = tuple(state_args[0] for state_args, _ in states)
+        self.delivered += 1
+        # Run as a task either way, so that errors are handled in one place.
+        task = asyncio.get_running_loop().create_task(self.run(args, kwargs))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+        try:
+            if self.is_coroutine:
+                await self.function(*args, **kwargs)  # type: ignore
+            else:
+                self.function(*args, **kwargs)  # type: ignore
+        except Exception as exception:
+            # Nothing awaits a coalesced call, so it's reported here.
+            if error_handler is not None:
+                await error_handler(self.event_name or str(self.function))
+            else:
+                asyncio.get_running_loop().call_exception_handler(
+                    {
+                        "message": f"Coalesced call to `{self.function}` failed.",
+                        "exception": exception,
+                    }
+                )
+
+    def flush_all(self) -> None:
+        """Deliver every held call now, cancelling their timers."""
+        for key in tuple(self.pending):
+            self.flush(key)
+
+    async def close(self) -> None:
+        """Deliver every held call, and wait for them to finish."""
+        self.flush_all()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "pending": len(self.pending),
+        }
@@ -0,0 +1,134 @@
+"""Differential syncing of application commands.  The payload of every scope
+(each guild, and global) is hashed, and a scope is only synced when its hash
+differs from the one last synced.  Hashes are persisted, so a restart without
+command changes doesn't sync at all.  A scope without a hash is always synced,
+as it may still have stale commands on Discord, even with none locally."""
+
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+from typing import Any, Optional
+
+from discord.abc import Snowflake
+from discord.app_commands import CommandTree as DCommandTree
+
+
+class CommandSync:
+    """Syncs only the scopes whose commands changed, a few at a time."""
+
+    def __init__(
+        self,
+        tree: DCommandTree,
+        path: Optional[str] = None,
+        max_concurrency: int = 2,
+        interval: float = 1.0,
+    ) -> None:
+        self.tree = tree
+        self.path = pathlib.Path(path) if path else None
+        self.max_concurrency = max_concurrency
+        self.interval = interval
+        self.application_id: Optional[int] = None
+        # Scope (`"global"` or a guild ID) -> hash of the last synced payload
+        self.hashes: dict[str, str] = {}
+        self.in_flight: dict[str, asyncio.Task] = {}
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        # Metrics
+        self.synced: int = 0
+        self.skipped: int = 0
+        self.load()
+
+    def load(self) -> None:
+        if self.path is None or not self.path.is_file():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except ValueError:
+            return
+        self.application_id = data.get("application_id")
+        self.hashes = data.get("scopes", {})
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        data = {"application_id": self.application_id, "scopes": self.hashes}
+        # Replaced whole, so that a crash mid-write can't corrupt it.
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        os.replace(temporary, self.path)
+
+    @staticmethod
+    def get_scope(guild: Optional[Snowflake]) -> str:
+        return "global" if guild is None else str(guild.id)
+
+    def get_payload(self, guild: Optional[Snowflake]) -> list[dict[str, Any]]:
+        payload = []
+        for command in self.tree.get_commands(guild=guild):
+            try:
+                payload.append(command.to_dict(self.tree))  # type: ignore
+            except TypeError:
+                # `discord.py` < 2.4
+                payload.append(command.to_dict())  # type: ignore
+        return sorted(payload, key=lambda command: command["name"])
+
+    def get_hash(self, guild: Optional[Snowflake]) -> str:
+        payload = json.dumps(self.get_payload(guild), sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def changed(self, guild: Optional[Snowflake]) -> bool:
+        # Unknown scopes count as changed.
+        stored = self.hashes.get(self.get_scope(guild))
+        return stored != self.get_hash(guild)
+
+    async def sync(
+        self, *guilds: Optional[Snowflake], force: bool = False
+    ) -> list[Optional[Snowflake]]:
+        """Sync the given scopes (`None` being global) if they changed.
+        Returns the scopes that were actually synced."""
+        # Hashes for another application are meaningless.
+        application_id = self.tree.client.application_id
+        if application_id != self.application_id:
+            self.application_id = application_id
+            self.hashes = {}
+        tasks = []
+        for guild in guilds:
+            scope = self.get_scope(guild)
+            task = self.in_flight.get(scope)
+            if task is None:
+                if not force and not self.changed(guild):
+                    self.skipped += 1
+                    continue
+                task = asyncio.create_task(self.sync_scope(guild, force))
+                self.in_flight[scope] = task
+                task.add_done_callback(lambda _, scope=scope: self.in_flight.pop(scope))
+            tasks.append((guild, task))
+        synced = []
+        for guild, task in tasks:
+            if await task:
+                synced.append(guild)
+        return synced
+
+    async def sync_scope(self, guild: Optional[Snowflake], force: bool = False) -> bool:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            # Rechecked, as another sync may have finished while waiting.
+            digest = self.get_hash(guild)
+            scope = self.get_scope(guild)
+            if not force and self.hashes.get(scope) == digest:
+                return False
+            await self.tree.sync(guild=guild)
+            self.hashes[scope] = digest
+            self.synced += 1
+            self.save()
+            # Spread syncs out, rather than bursting into the rate limit.
+            await asyncio.sleep(self.interval)
+        return True
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "synced": self.synced,
+            "skipped": self.skipped,
+            "in_flight": len(self.in_flight),
+        }
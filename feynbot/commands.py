@@ -1,48 +1,65 @@
 """The command and command tree classes."""
 
 from asyncio import iscoroutinefunction
+from functools import partial
 from types import ModuleType
-from typing import Any, Awaitable, Callable, Collection, Iterator, Optional
-from inspect import currentframe
+from typing import Any, Awaitable, Callable, Iterator, Optional
 
 from discord import Object as DObject
 from discord.app_commands import Command as DCommand
-from anytree import NodeMixin, RenderTree
+from anytree import NodeMixin, PreOrderIter, RenderTree
 
-from Feynbot.utility import check_kwargs
+from Feynbot.context import Context, get_injector, get_parameters
+from Feynbot.executors import get_node_pool
+from Feynbot.instrumentation import instrument
+from Feynbot.utility import check_kwargs, pop_origin
 
 # IMPLEMENT: handling parameters, autocomplete, syncing, etc.
 
 
 class CommandTree(NodeMixin):
+    # Slotted like `EventTree`, as overrides are generated per guild.
+    __slots__ = (
+        "_NodeMixin__parent",
+        "_NodeMixin__children",
+        "name",
+        "origin",
+        "file_path",
+        "enabled",
+        "_executor",
+        "gids",
+        "resolutions",
+    )
+
     def __init__(
         self,
         node_name: Optional[str] = None,
         enabled: bool = True,
         gid: Optional[int] = None,
         gids: Optional[list[int]] = None,
+        executor: Optional[str] = None,
         **kwargs: Any,
     ) -> None:
         # Pre-Initialization
-        self.override_commands: dict[str, dict[int, Command]] = {}
-        self.global_commands: dict[str, Command] = {}
+        self._executor: Optional[str] = None
+        # (command name, guild ID or `None` for global) -> command.  Only kept
+        # by roots (see `register_command`).
+        self.resolutions: Optional[dict[tuple[str, Optional[int]], Command]] = None
+        self.gids: tuple[int, ...] = ()
+        # Get file info from where this was defined
+        self.origin, self.file_path = pop_origin(kwargs)
         # Construct node
         super().__init__()
         # Check for parent
         parent = kwargs.pop("parent", None)
         if parent:
             self.parent_to(parent, inherit=True)
-        # Get file info from where this was defined
-        caller_variables = currentframe().f_back.f_globals  # type: ignore
-        self.origin = kwargs.pop("origin", caller_variables["__name__"])
-        self.file_path = kwargs.pop("file_path", caller_variables["__file__"])
         # Set attributes
         self.name = node_name or self.origin
-        self.signature = self.name
         self.enabled = enabled
+        get_node_pool(executor)
+        self._executor = executor or self._executor
 
-        self.gids: list[int] = list()
-        self.is_global: bool = True
         if gids and gid:
             raise ValueError("Cannot have both `gid` and `gids`.")
         if gid:
@@ -51,20 +68,42 @@ class CommandTree(NodeMixin):
             self.set_gids(*gids)
         check_kwargs(kwargs)
 
+    @property
+    def signature(self) -> str:
+        return self.name
+
+    @property
+    def executor(self) -> Optional[str]:
+        """The pool (see `executors.node_pools`) sync functions run on."""
+        return self._executor
+
+    @executor.setter
+    def executor(self, value: Optional[str]) -> None:
+        get_node_pool(value)
+        self._executor = value
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Drop the calls compiled for the commands in this tree."""
+        for command in self:
+            command.call = None
+
     # GID Methods
-    # FIX: All of these methods have the potential to break the tree structure since
-    # they don't update whether they store the command globally or as an override.
+    @property
+    def is_global(self) -> bool:
+        return len(self.gids) == 0
+
     def set_gids(self, *gids: int) -> None:
-        self.gids = list(gids)
-        self.is_global = len(self.gids) == 0
+        self.update_gids(tuple(dict.fromkeys(gids)))
 
     def add_gids(self, *gids: int) -> None:
-        self.gids.extend([gid for gid in gids if gid not in self.gids])
-        self.is_global = len(self.gids) == 0
+        self.set_gids(*self.gids, *gids)
 
     def remove_gids(self, *gids: int) -> None:
-        self.gids = [gid for gid in self.gids if gid not in gids]
-        self.is_global = len(self.gids) == 0
+        self.set_gids(*[gid for gid in self.gids if gid not in gids])
+
+    def update_gids(self, gids: tuple[int, ...]) -> None:
+        self.gids = gids
 
     def get_gid_snowflakes(self) -> tuple[DObject]:
         snowflakes = []
@@ -80,34 +119,53 @@ class CommandTree(NodeMixin):
         is_global: Optional[bool] = None,
         gid: Optional[int] = None,
     ) -> bool:
+        resolutions = self.get_resolutions()
         if is_global is None:
-            return self.has(command_name, True) or self.has(command_name, False)
+            return self.has(command_name, is_global=True) or self.has(
+                command_name, is_global=False, gid=gid
+            )
         if is_global:
-            return command_name in self.global_commands
-        if command_name in self.override_commands:
-            command_set = self.override_commands[command_name]
-            if gid is not None:
-                return gid in command_set
-            return len(command_set) > 0
-        return False
+            return (command_name, None) in resolutions
+        if gid is not None:
+            return (command_name, gid) in resolutions
+        return any(
+            name == command_name and key_gid is not None
+            for name, key_gid in resolutions
+        )
 
     def parent_to(self, parent: "CommandTree", inherit: bool = True) -> None:
+        if self.parent is not None:
+            self.detach()
+        # A root's resolutions hold everything under it, which moves to the new
+        # root.
+        commands = tuple(dict.fromkeys((self.resolutions or {}).values()))
+        self.resolutions = None
         self.parent = parent
         if inherit:
             self.inherit_from(parent)
-        for command in self.global_commands.values():
+        for command in commands:
             parent.register_command(command)
-        for command_set in self.override_commands.values():
-            for command in command_set.values():
-                parent.register_command(command)
 
     def inherit_from(self, node: "CommandTree") -> None:
         self.enabled = node.enabled
+        self.executor = node.executor
         self.set_gids(*node.gids)
 
     def adopt_tree(self, child: "CommandTree", inherit: bool = True) -> None:
         child.parent_to(self, inherit=inherit)
 
+    def detach(self) -> None:
+        """Remove this tree (and its commands) from its parent."""
+        parent = self.parent
+        if parent is None:
+            return
+        commands = tuple(self)
+        for command in commands:
+            parent.unregister_command(command)
+        self.parent = None
+        for command in commands:
+            self.register_command(command)
+
     # Command Methods
     def bind(
         self,
@@ -118,61 +176,81 @@ class CommandTree(NodeMixin):
         gids: Optional[list[int]] = None,
         **kwargs: Any,
     ) -> Callable[[Callable], None]:
-        # Get file info from where this was defined
-        caller_variables = currentframe().f_back.f_globals  # type: ignore
-        origin = kwargs.pop("origin", caller_variables["__name__"])
-        file_path = kwargs.pop("file_path", caller_variables["__file__"])
-
+        origin, file_path = pop_origin(kwargs)
         command = Command(
             command_name=command_name,
             node_name=node_name,
             enabled=enabled,
             gid=gid,
             gids=gids,
-            origin=kwargs.get("origin", origin),
-            file_path=kwargs.get("file_path", file_path),
+            origin=origin,
+            file_path=file_path,
             parent=self,
             **kwargs,
         )
         decorator = command.bind(command_name)
         return decorator
 
-    def register_command(self, command: "Command", recursive: bool = True) -> None:
-        command_name = command.name
+    def register_command(self, command: "Command") -> None:
+        command_name = command.command_name
         if command_name is None:
             raise ValueError(f"Command `{command}` has no name.")
-        # Global command:
-        if command.is_global:
-            self.global_commands[command_name] = command
-        # Override command:
-        if command_name not in self.override_commands:
-            self.override_commands[command_name] = {}
-        command_set = self.override_commands[command_name]
-        for gid in command.gids:
-            # If preexisting:
-            if gid in command_set and command_set[gid] != command:
-                raise ValueError(
-                    f"Command `{command}` conflicts with `{command_set[gid]}`."
-                )
-            command_set[gid] = command
-        if self.parent and recursive:
-            self.parent.register_command(command)
+        root = self.root
+        if root.resolutions is None:
+            root.resolutions = {}
+        # Global (`None`) or override commands, if not preexisting:
+        for gid in command.gids or (None,):
+            existing = root.resolutions.get((command_name, gid))
+            if existing is not None and existing != command:
+                raise ValueError(f"Command `{command}` conflicts with `{existing}`.")
+        for gid in command.gids or (None,):
+            root.resolutions[(command_name, gid)] = command
+
+    def unregister_command(self, command: "Command") -> None:
+        command_name: str = command.command_name  # type: ignore
+        resolutions = self.root.resolutions
+        if resolutions is None:
+            return
+        for gid in command.gids or (None,):
+            if resolutions.get((command_name, gid)) is command:
+                del resolutions[(command_name, gid)]
+
+    def get_resolutions(self) -> dict[tuple[str, Optional[int]], "Command"]:
+        """The commands in this tree by name and guild.  Only the root keeps
+        these, so they're gathered for every other tree."""
+        if self.parent is None:
+            return self.resolutions or {}
+        resolutions: dict[tuple[str, Optional[int]], Command] = {}
+        for command in self:
+            for gid in command.gids or (None,):
+                resolutions[(command.command_name, gid)] = command  # type: ignore
+        return resolutions
+
+    def resolve(self, command_name: str, gid: Optional[int] = None) -> "Command":
+        """Get the command to run in a guild, be it its override or global."""
+        resolutions = self.get_resolutions()
+        command = resolutions.get((command_name, gid))
+        if command is None and gid is not None:
+            command = resolutions.get((command_name, None))
+        if command is None:
+            raise IndexError(
+                f"Command `{command_name}` not found in `{self.signature}` for "
+                f"guild `{gid}`."
+            )
+        return command
 
-    async def fire(self, name: str, *args, **kwargs) -> None:
-        # IMPLEMENT:  Overrides need to be specially handled here.
-        pass
+    async def fire(self, name: str, *args, gid: Optional[int] = None, **kwargs) -> None:
+        await self.resolve(name, gid).fire(*args, **kwargs)
 
     # Special Methods
     def __call__(self, name: str, *args, **kwargs) -> Awaitable[None]:
         return self.fire(name, *args, **kwargs)
 
     def __iter__(self) -> Iterator["Command"]:
-        global_commands: Collection[Command] = self.global_commands.values()
-        override_commands: list[Command] = []
-        for command_set in self.override_commands.values():
-            override_commands += command_set.values()
-        all_commands: tuple[Command] = tuple(global_commands) + tuple(override_commands)
-        return iter(all_commands)
+        """Iterate over the bound commands in this tree, in tree order."""
+        for node in PreOrderIter(self):
+            if isinstance(node, Command) and node.command_name is not None:
+                yield node
 
     def __str__(self) -> str:
         string = f"{self.name}"
@@ -187,38 +265,60 @@ class CommandTree(NodeMixin):
 
 
 class Command(CommandTree):
+    __slots__ = (
+        "node_name",
+        "command_name",
+        "description",
+        "function",
+        "is_coroutine",
+        "parameters",
+        "discord_command",
+        "own_executor",
+        "call",
+    )
+
     def __init__(
         self,
         command_name: Optional[str] = None,
         node_name: Optional[str] = None,
         enabled: bool = True,
         gid: Optional[int] = None,
-        gids: Optional[list[int]] = None,  # CHANGE: This can be made `set[int]`
+        gids: Optional[list[int]] = None,
+        executor: Optional[str] = None,
         **kwargs: Any,
     ) -> None:
         # Pre-Initialization
         self.description: str = kwargs.pop("description", "(No description)")
-        # Get file info from where this was defined
-        caller_variables = currentframe().f_back.f_globals  # type: ignore
-        origin = kwargs.pop("origin", caller_variables["__name__"])
-        file_path = kwargs.pop("file_path", caller_variables["__file__"])
+        self.node_name: Optional[str] = node_name
+        # Set on binding
+        self.command_name: Optional[str] = None
+        self.function: Optional[Callable[..., Optional[Awaitable[None]]]] = None
+        self.is_coroutine: bool = False
+        # The context attributes `function` takes
+        self.parameters: tuple[str, ...] = ()
+        self.discord_command: Optional[DCommand] = None
+        # Passed for this command, rather than inherited from its tree
+        self.own_executor: Optional[str] = executor
+        # Compiled by `get_call`, like an event's plan
+        self.call: Optional[tuple[Callable[[Context], Any], bool]] = None
+        origin, file_path = pop_origin(kwargs)
         # Construct node
         super().__init__(
             node_name=node_name,
             enabled=enabled,
             gid=gid,
             gids=gids,
-            origin=kwargs.get("origin", origin),
-            file_path=kwargs.get("file_path", file_path),
+            executor=executor,
+            origin=origin,
+            file_path=file_path,
             **kwargs,
         )
         # Set attributes
-        self.node_name: Optional[str] = node_name
-        self.signature = self.signature + " $ "
-        self.command_name: Optional[str] = command_name
-        self.function: Optional[Callable[..., Optional[Awaitable[None]]]] = None
-        self.is_coroutine: bool
-        self.discord_command: Optional[DCommand] = None
+        self.command_name = command_name
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name} $ {self.command_name or ''}"
 
     def bind(
         self,
@@ -253,13 +353,38 @@ class Command(CommandTree):
                 )
             self.name = self.name or node_name
             self.is_coroutine = iscoroutinefunction(function)
+            self.parameters = get_parameters(function)
+            # A tree's executor only applies to its sync functions.
+            if self.is_coroutine and self.own_executor is not None:
+                raise ValueError(
+                    f"Command `{command_name}` from `{self.origin}` is a coroutine "
+                    f"and can't be run on the `{self.own_executor}` executor."
+                )
+            self.call = None
 
         self.description = kwargs.get("description", self.description)
         self.command_name = command_name
-        self.signature = self.signature + self.command_name
         self.register_command(self)
         return decorator
 
+    def update_gids(self, gids: tuple[int, ...]) -> None:
+        # Commands are registered by GID, so they need to be re-registered.
+        registered = self.command_name is not None
+        previous = self.gids
+        if registered:
+            self.unregister_command(self)
+        super().update_gids(gids)
+        if not registered:
+            return
+        try:
+            self.register_command(self)
+        except ValueError:
+            # Conflicting, so registered back under the previous GIDs.
+            self.unregister_command(self)
+            super().update_gids(previous)
+            self.register_command(self)
+            raise
+
     def initialized(self) -> bool:
         if self.function is None:
             return False
@@ -275,10 +400,25 @@ class Command(CommandTree):
                 f"Command {self.command_name} from file {self.origin} not bound "
                 f"to any valid function but was called."
             )
-        if iscoroutinefunction(self.function):
-            await self.function(*args, **kwargs)
+        function, is_coroutine = self.get_call()
+        if is_coroutine:
+            await function(*args, **kwargs)
+        else:
+            function(*args, **kwargs)
+
+    def get_call(self) -> tuple[Callable[[Context], Any], bool]:
+        """Get the callable to dispatch a context to and whether it must be
+        awaited, compiled once."""
+        if self.call is not None:
+            return self.call
+        pool = None if self.is_coroutine else get_node_pool(self.executor)
+        if pool is not None:
+            function = partial(pool.run, self.function)
+            call = get_injector(function, self.parameters), True
         else:
-            self.function(*args, **kwargs)
+            call = get_injector(self.function, self.parameters), self.is_coroutine  # type: ignore
+        self.call = instrument("command", self, call)
+        return self.call
 
     def __call__(self, *args: Any, **kwds: Any) -> Awaitable[None]:
         return self.fire(*args, **kwds)
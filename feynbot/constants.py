@@ -57,6 +57,9 @@ events_list: list[str] = [
     "on_message_edit",
     "on_message_delete",
     "on_bulk_message_delete",
+    "on_raw_message_edit",  # Fires for uncached messages too
+    "on_raw_message_delete",
+    "on_raw_bulk_message_delete",
     # Reactions
     "on_reaction_add",
     "on_reaction_remove",
@@ -90,3 +93,109 @@ events_list: list[str] = [
     "on_guild_integrations_update",
     "on_webhooks_update",
 ]
+
+# The gateway intents each event needs to be received.  Events not listed here
+# (connection, debug, and interaction events) don't need any.
+event_intents: dict[str, tuple[str, ...]] = {
+    # Automod
+    "on_automod_rule_create": ("auto_moderation_configuration",),
+    "on_automod_rule_update": ("auto_moderation_configuration",),
+    "on_automod_rule_delete": ("auto_moderation_configuration",),
+    "on_automod_action": ("auto_moderation_execution",),
+    # Guilds
+    "on_guild_available": ("guilds",),
+    "on_guild_unavailable": ("guilds",),
+    "on_guild_join": ("guilds",),
+    "on_guild_remove": ("guilds",),
+    "on_guild_update": ("guilds",),
+    "on_guild_emojis_update": ("emojis_and_stickers",),
+    "on_guild_stickers_update": ("emojis_and_stickers",),
+    "on_audit_log_entry_create": ("moderation",),
+    "on_invite_create": ("invites",),
+    "on_invite_delete": ("invites",),
+    # Channels
+    "on_guild_channel_create": ("guilds",),
+    "on_guild_channel_delete": ("guilds",),
+    "on_guild_channel_update": ("guilds",),
+    "on_guild_channel_pins_update": ("guilds",),
+    "on_private_channel_update": ("dm_messages",),
+    "on_private_channel_pins_update": ("dm_messages",),
+    "on_typing": ("guild_typing", "dm_typing"),
+    # Voice
+    "on_voice_state_update": ("voice_states",),
+    # Members
+    "on_member_join": ("members",),
+    "on_member_remove": ("members",),
+    "on_member_update": ("members",),
+    "on_user_update": ("members",),
+    "on_member_ban": ("moderation",),
+    "on_member_unban": ("moderation",),
+    "on_presence_update": ("presences",),
+    # Messages
+    "on_message": ("guild_messages", "dm_messages", "message_content"),
+    "on_message_edit": ("guild_messages", "dm_messages", "message_content"),
+    "on_message_delete": ("guild_messages", "dm_messages"),
+    "on_bulk_message_delete": ("guild_messages",),
+    "on_raw_message_edit": ("guild_messages", "dm_messages"),
+    "on_raw_message_delete": ("guild_messages", "dm_messages"),
+    "on_raw_bulk_message_delete": ("guild_messages",),
+    # Reactions
+    "on_reaction_add": ("guild_reactions", "dm_reactions"),
+    "on_reaction_remove": ("guild_reactions", "dm_reactions"),
+    "on_reaction_clear": ("guild_reactions", "dm_reactions"),
+    "on_reaction_clear_emoji": ("guild_reactions", "dm_reactions"),
+    # Roles
+    "on_guild_role_create": ("guilds",),
+    "on_guild_role_delete": ("guilds",),
+    "on_guild_role_update": ("guilds",),
+    # Events
+    "on_scheduled_event_create": ("guild_scheduled_events",),
+    "on_scheduled_event_delete": ("guild_scheduled_events",),
+    "on_scheduled_event_update": ("guild_scheduled_events",),
+    "on_scheduled_event_user_add": ("guild_scheduled_events",),
+    "on_scheduled_event_user_remove": ("guild_scheduled_events",),
+    # Stages
+    "on_stage_instance_create": ("guilds",),
+    "on_stage_instance_delete": ("guilds",),
+    "on_stage_instance_update": ("guilds",),
+    # Threads
+    "on_thread_create": ("guilds",),
+    "on_thread_join": ("guilds",),
+    "on_thread_update": ("guilds",),
+    "on_thread_remove": ("guilds",),
+    "on_thread_delete": ("guilds",),
+    "on_thread_member_join": ("guilds", "members"),
+    "on_thread_member_remove": ("guilds", "members"),
+    # Integrations
+    "on_integration_create": ("integrations",),
+    "on_integration_update": ("integrations",),
+    "on_guild_integrations_update": ("integrations",),
+    "on_webhooks_update": ("webhooks",),
+}
+
+# Intents every bot needs, regardless of listeners (`discord.py` relies on
+# `guilds` to populate its cache).
+base_intents: tuple[str, ...] = ("guilds",)
+
+# Every individual intent, as named in `intents.json`.
+intent_names: tuple[str, ...] = (
+    "guilds",
+    "members",
+    "moderation",
+    "emojis_and_stickers",
+    "integrations",
+    "webhooks",
+    "invites",
+    "voice_states",
+    "presences",
+    "guild_messages",
+    "dm_messages",
+    "guild_reactions",
+    "dm_reactions",
+    "guild_typing",
+    "dm_typing",
+    "message_content",
+    "guild_scheduled_events",
+    "auto_moderation_configuration",
+    "auto_moderation_execution",
+)
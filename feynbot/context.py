@@ -2,42 +2,303 @@
 command, event, or interaction.  Allowing for easy access for the user to code
 without needing to know the specifics."""
 
+import inspect
+from operator import attrgetter
+from typing import Any, Callable, Optional
+from weakref import WeakKeyDictionary
+
 import discord
 
+# Marks lazily resolved attributes that haven't been resolved yet.
+unresolved: Any = object()
+
 
 class Context:
     """Contains relevant information about a command, event, or interaction and
-    methods to interact with it."""
+    methods to interact with it.  Anything derived from the raw arguments is
+    only resolved when first accessed."""
+
+    __slots__ = (
+        "bot",
+        "db",
+        "name",
+        "args",
+        "kwargs",
+        "batch",
+        "_raw",
+        "_guild",
+        "_channel",
+        "_user",
+        "_message",
+    )
 
     def __init__(
         self,
-        message: discord.Message,
-        guild: discord.Guild,
-        channel: discord.TextChannel,
-        member: discord.Member,
-        author: discord.User,
-        roles: list[discord.Role],
-        user: discord.User,
+        bot: Any = None,
+        name: Optional[str] = None,
+        args: tuple[Any, ...] = (),
+        kwargs: Optional[dict[str, Any]] = None,
+        db: Any = None,
     ) -> None:
         """Initialize the context."""
-        self.message = message
-        self.guild = guild
-        self.channel = channel
-        self.member = member
-        self.author = author
-        self.roles = roles
-        self.user = user
-
-        # is DMs?
-        # is command?
-        # is event?
-        # is admin?/owner
-        # is bot?
-        # time
-        # get permissions
-        # reply
-        # react
-        # delete
-        # pin
-        # edit
-        # sendTo
+        self.bot = bot
+        self.db = db
+        # The event or command name
+        self.name = name
+        # The arguments `discord.py` dispatched with
+        self.args = args
+        self.kwargs = kwargs
+        # Every context coalesced into this one (see `coalescing.py`)
+        self.batch: tuple[Context, ...] = ()
+        self._raw: Any = unresolved
+        self._guild: Any = unresolved
+        self._channel: Any = unresolved
+        self._user: Any = unresolved
+        self._message: Any = unresolved
+
+    @property
+    def context(self) -> "Context":
+        return self
+
+    @property
+    def raw(self) -> dict[str, Any]:
+        if self._raw is unresolved:
+            self._raw = {"args": self.args, **(self.kwargs or {})}
+        return self._raw
+
+    @property
+    def guild(self) -> Optional[discord.Guild]:
+        if self._guild is unresolved:
+            self._guild = find_guild(*self.args)
+        return self._guild
+
+    @property
+    def channel(self) -> Optional[Any]:
+        if self._channel is unresolved:
+            self._channel = find_channel(*self.args)
+        return self._channel
+
+    @property
+    def user(self) -> Optional[discord.abc.User]:
+        if self._user is unresolved:
+            # Messages and interactions carry it directly.
+            first = self.args[0] if self.args else None
+            user = getattr(first, "author", None) or getattr(first, "user", None)
+            if not isinstance(user, user_types):
+                user = find_user(*self.args)
+            self._user = user
+        return self._user
+
+    @property
+    def author(self) -> Optional[discord.abc.User]:
+        return self.user
+
+    @property
+    def member(self) -> Optional[discord.Member]:
+        user = self.user
+        return user if isinstance(user, discord.Member) else None
+
+    @property
+    def roles(self) -> list[discord.Role]:
+        member = self.member
+        return member.roles if member else []
+
+    @property
+    def message(self) -> Optional[discord.Message]:
+        if self._message is unresolved:
+            self._message = find_message(*self.args)
+        return self._message
+
+    @property
+    def payload(self) -> Any:
+        """The payload of raw events (`on_raw_*`)."""
+        return self.args[0] if self.args else None
+
+    @property
+    def arguments(self) -> list[str]:
+        """The arguments of a message command (see `message_commands.py`)."""
+        return (self.kwargs or {}).get("arguments", [])
+
+    @property
+    def cached_message(self) -> Any:
+        """The message this concerns, from the bot's compact message cache (see
+        `message_cache.py`), with its content from before any edit or delete
+        being handled."""
+        message_id = getattr(self.message, "id", None)
+        if message_id is None:
+            message_id = getattr(self.payload, "message_id", None)
+        cache = getattr(self.bot, "message_cache", None)
+        if message_id is None or cache is None:
+            return None
+        return cache.get(message_id)
+
+    @property
+    def oids(self) -> tuple[Optional[int], Optional[int], Optional[int]]:
+        guild, channel, user = self.guild, self.channel, self.user
+        return (
+            guild.id if guild else None,
+            getattr(channel, "id", None),
+            user.id if user else None,
+        )
+
+    async def get_settings(self) -> dict[str, Any]:
+        """Get the settings of the guild this happened in (or the defaults)."""
+        guild = self.guild
+        return await self.bot.settings.get(guild.id if guild else None)
+
+    async def get_members(self) -> list[discord.Member]:
+        """Get every member of the guild this happened in, chunking it first
+        if it hasn't been (see `members.py`)."""
+        guild = self.guild
+        if guild is None:
+            return []
+        chunker = getattr(self.bot, "chunker", None)
+        if chunker is None:
+            return guild.members
+        return await chunker.chunk(guild)
+
+    async def reply(self, content: Optional[str] = None, **kwargs: Any) -> Any:
+        """Respond to the interaction, or send to the channel, through the
+        bot's outbox (see `outbound.py`)."""
+        if self.args and isinstance(self.args[0], discord.Interaction):
+            return await self.bot.respond(self.args[0], content, **kwargs)
+        if self.channel is None:
+            raise ValueError(f"`{self.name}` has no channel to reply in.")
+        # Only interaction responses can be ephemeral.
+        kwargs.pop("ephemeral", None)
+        return await self.bot.send(self.channel, content, **kwargs)
+
+    # is DMs?
+    # is command?
+    # is event?
+    # is admin?/owner
+    # is bot?
+    # time
+    # get permissions
+    # react
+    # delete
+    # pin
+    # edit
+    # sendTo
+
+
+# Passing only what each event or command asks for
+default_parameters: tuple[str, ...] = ("context", "bot", "db", "raw")
+
+
+# Inspecting signatures is slow, and generated listeners often share functions.
+parameter_cache: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def get_parameters(function: Callable[..., Any]) -> tuple[str, ...]:
+    """Get the context attributes a function takes as keyword arguments.  A
+    `**kwargs` takes the defaults, but an ignored `**_` takes nothing."""
+    try:
+        return parameter_cache[function]
+    except (KeyError, TypeError):
+        pass
+    parameters = inspect_parameters(function)
+    try:
+        parameter_cache[function] = parameters
+    except TypeError:
+        # Not weakly referenceable
+        pass
+    return parameters
+
+
+def inspect_parameters(function: Callable[..., Any]) -> tuple[str, ...]:
+    names = []
+    for parameter in inspect.signature(function).parameters.values():
+        if parameter.kind is parameter.VAR_KEYWORD:
+            if not parameter.name.startswith("_"):
+                return tuple(dict.fromkeys(names + list(default_parameters)))
+            continue
+        if parameter.kind not in (
+            parameter.POSITIONAL_OR_KEYWORD,
+            parameter.KEYWORD_ONLY,
+        ):
+            continue
+        if parameter.name.startswith("_") or not hasattr(Context, parameter.name):
+            if parameter.default is parameter.empty:
+                raise ValueError(
+                    f"`{function.__name__}` takes `{parameter.name}`, which isn't "
+                    f"an attribute of `Context`."
+                )
+            continue
+        names.append(parameter.name)
+    return tuple(names)
+
+
+def get_injector(
+    function: Callable[..., Any], parameters: tuple[str, ...]
+) -> Callable[[Context], Any]:
+    """Wrap `function` to be called with a context, passing only the
+    attributes named in `parameters`."""
+    if len(parameters) == 0:
+        return lambda context: function()
+    getter = attrgetter(*parameters)
+    if len(parameters) == 1:
+        name = parameters[0]
+        return lambda context: function(**{name: getter(context)})
+    return lambda context: function(**dict(zip(parameters, getter(context))))
+
+
+# Resolving objects from the raw arguments `discord.py` dispatches with.
+# NOTE: `discord.abc.User` is a runtime-checkable protocol, as are voice and
+# stage channels (through `Connectable`), and `isinstance` against those takes
+# ~100µs, so only concrete classes and plain base classes are checked.
+user_types = (discord.User, discord.Member, discord.ClientUser)
+channel_types = (
+    discord.abc.GuildChannel,
+    discord.abc.PrivateChannel,
+    discord.Thread,
+    discord.PartialMessageable,
+)
+
+
+def find_guild(*args: Any) -> Optional[discord.Guild]:
+    for arg in args:
+        if isinstance(arg, discord.Guild):
+            return arg
+        guild = getattr(arg, "guild", None)
+        if isinstance(guild, discord.Guild):
+            return guild
+        # Reactions only reference their message:
+        message = getattr(arg, "message", None)
+        if isinstance(message, discord.Message) and message.guild:
+            return message.guild
+    return None
+
+
+def find_channel(*args: Any) -> Optional[Any]:
+    for arg in args:
+        if isinstance(arg, channel_types):
+            return arg
+        channel = getattr(arg, "channel", None)
+        if channel is not None:
+            return channel
+        message = getattr(arg, "message", None)
+        if isinstance(message, discord.Message):
+            return message.channel
+    return None
+
+
+def find_user(*args: Any) -> Optional[discord.abc.User]:
+    for arg in args:
+        if isinstance(arg, user_types):
+            return arg
+        for attribute in ("author", "user", "member"):
+            user = getattr(arg, attribute, None)
+            if isinstance(user, user_types):
+                return user
+    return None
+
+
+def find_message(*args: Any) -> Optional[discord.Message]:
+    for arg in args:
+        if isinstance(arg, discord.Message):
+            return arg
+        message = getattr(arg, "message", None)
+        if isinstance(message, discord.Message):
+            return message
+    return None
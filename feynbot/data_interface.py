@@ -1,5 +1,700 @@
-"""Collection of database oriented functions and classes."""
+"""Collection of database oriented functions and classes.
+
+`Interface` is the bot's async access to its data, injected into events and
+commands as `db`.  Data is stored as documents (dicts) in collections, keyed
+by `_id`.  Blocking backends run on a bounded pool of their own, so a slow
+database can't block the event loop, and gets made in the same iteration of
+the event loop are read in one batch per collection."""
+
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+from Feynbot.events import EventTree
+from Feynbot.executors import OffloadPool
+
+# A write is `(operation, key, fields)`, `fields` being ignored by `delete`.
+write_operations: tuple[str, ...] = ("set", "update", "increment", "delete")
+
+collection_pattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def apply_write(
+    document: Optional[dict[str, Any]],
+    key: Hashable,
+    operation: str,
+    fields: Optional[dict[str, Any]],
+) -> Optional[dict[str, Any]]:
+    """Get a document after a write, `None` meaning it was deleted.  Writes to
+    missing documents create them."""
+    if operation == "delete":
+        return None
+    if operation == "set" or document is None:
+        document = {"_id": key}
+        if operation == "set":
+            document.update(fields or {})
+            return document
+    if operation == "update":
+        document.update(fields or {})
+    elif operation == "increment":
+        for field, amount in (fields or {}).items():
+            document[field] = document.get(field, 0) + amount
+    return document
+
+
+def matches(document: dict[str, Any], filter: Optional[dict[str, Any]]) -> bool:
+    """Whether every field in `filter` equals the document's."""
+    if not filter:
+        return True
+    missing = object()
+    return all(document.get(field, missing) == value for field, value in filter.items())
+
+
+class Backend:
+    """Where the data is actually stored.  Methods are synchronous, and are
+    run on the interface's pool if `blocking`."""
+
+    blocking: bool = True
+
+    def get_many(
+        self, collection: str, keys: list[Hashable]
+    ) -> dict[Hashable, dict[str, Any]]:
+        raise NotImplementedError
+
+    def find(
+        self, collection: str, filter: Optional[dict[str, Any]], limit: int
+    ) -> list[dict[str, Any]]:
+        raise NotImplementedError
+
+    def bulk_write(
+        self,
+        collection: str,
+        operations: list[tuple[str, Hashable, Optional[dict[str, Any]]]],
+    ) -> None:
+        """Apply writes in order, as one batch."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(Backend):
+    """Keeps everything in memory, for tests and benchmarks.  Documents are
+    copied in and out, as they would be (de)serialized by a database."""
+
+    blocking = False
+
+    def __init__(self) -> None:
+        self.collections: dict[str, dict[Hashable, dict[str, Any]]] = {}
+
+    def get_many(
+        self, collection: str, keys: list[Hashable]
+    ) -> dict[Hashable, dict[str, Any]]:
+        documents = self.collections.get(collection, {})
+        return {key: deepcopy(documents[key]) for key in keys if key in documents}
+
+    def find(
+        self, collection: str, filter: Optional[dict[str, Any]], limit: int
+    ) -> list[dict[str, Any]]:
+        found = []
+        for document in self.collections.get(collection, {}).values():
+            if matches(document, filter):
+                found.append(deepcopy(document))
+                if len(found) == limit:
+                    break
+        return found
+
+    def bulk_write(
+        self,
+        collection: str,
+        operations: list[tuple[str, Hashable, Optional[dict[str, Any]]]],
+    ) -> None:
+        documents = self.collections.setdefault(collection, {})
+        for operation, key, fields in operations:
+            document = apply_write(documents.get(key), key, operation, deepcopy(fields))
+            if document is None:
+                documents.pop(key, None)
+            else:
+                documents[key] = document
+
+
+class SQLiteBackend(Backend):
+    """Stores each collection as a table of JSON documents.  Each worker
+    thread of the pool gets its own connection."""
+
+    def __init__(self, path: str = "feynbot.db", busy_timeout: float = 5.0) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.connections: list[sqlite3.Connection] = []
+        self.tables: set[str] = set()
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def get_table(self, connection: sqlite3.Connection, collection: str) -> str:
+        if not collection_pattern.match(collection):
+            raise ValueError(f"`{collection}` is not a valid collection name.")
+        if collection not in self.tables:
+            with connection:
+                connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{collection}" '
+                    f"(key TEXT PRIMARY KEY, document TEXT NOT NULL)"
+                )
+            self.tables.add(collection)
+        return f'"{collection}"'
+
+    def get_many(
+        self, collection: str, keys: list[Hashable]
+    ) -> dict[Hashable, dict[str, Any]]:
+        connection = self.connect()
+        table = self.get_table(connection, collection)
+        documents = {}
+        # SQLite limits the number of variables in a query.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            encoded = {json.dumps(key): key for key in chunk}
+            rows = connection.execute(
+                f"SELECT key, document FROM {table} WHERE key IN "
+                f"({', '.join('?' * len(encoded))})",
+                tuple(encoded),
+            )
+            for key, document in rows:
+                documents[encoded[key]] = json.loads(document)
+        return documents
+
+    def find(
+        self, collection: str, filter: Optional[dict[str, Any]], limit: int
+    ) -> list[dict[str, Any]]:
+        connection = self.connect()
+        table = self.get_table(connection, collection)
+        found = []
+        for (document,) in connection.execute(f"SELECT document FROM {table}"):
+            document = json.loads(document)
+            if matches(document, filter):
+                found.append(document)
+                if len(found) == limit:
+                    break
+        return found
+
+    def bulk_write(
+        self,
+        collection: str,
+        operations: list[tuple[str, Hashable, Optional[dict[str, Any]]]],
+    ) -> None:
+        connection = self.connect()
+        table = self.get_table(connection, collection)
+        # One transaction for the whole batch
+        with connection:
+            for operation, key, fields in operations:
+                encoded = json.dumps(key)
+                document = None
+                if operation in ("update", "increment"):
+                    row = connection.execute(
+                        f"SELECT document FROM {table} WHERE key = ?", (encoded,)
+                    ).fetchone()
+                    document = json.loads(row[0]) if row else None
+                document = apply_write(document, key, operation, fields)
+                if document is None:
+                    connection.execute(f"DELETE FROM {table} WHERE key = ?", (encoded,))
+                    continue
+                connection.execute(
+                    f"INSERT OR REPLACE INTO {table} (key, document) VALUES (?, ?)",
+                    (encoded, json.dumps(document)),
+                )
+
+    def close(self) -> None:
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+class MongoBackend(Backend):
+    """Stores collections in MongoDB, through `pymongo`'s connection pool."""
+
+    def __init__(
+        self,
+        uri: str = "mongodb://localhost:27017",
+        database: str = "feynbot",
+        pool_size: int = 4,
+        **options: Any,
+    ) -> None:
+        try:
+            import pymongo
+        except ImportError as error:
+            raise ImportError(
+                "The `mongo` database backend needs `pymongo` to be installed."
+            ) from error
+        self.pymongo = pymongo
+        self.client = pymongo.MongoClient(uri, maxPoolSize=pool_size, **options)
+        self.database = self.client[database]
+
+    def get_many(
+        self, collection: str, keys: list[Hashable]
+    ) -> dict[Hashable, dict[str, Any]]:
+        cursor = self.database[collection].find({"_id": {"$in": keys}})
+        return {document["_id"]: document for document in cursor}
+
+    def find(
+        self, collection: str, filter: Optional[dict[str, Any]], limit: int
+    ) -> list[dict[str, Any]]:
+        return list(self.database[collection].find(filter or {}, limit=limit))
+
+    def bulk_write(
+        self,
+        collection: str,
+        operations: list[tuple[str, Hashable, Optional[dict[str, Any]]]],
+    ) -> None:
+        pymongo = self.pymongo
+        requests: list[Any] = []
+        for operation, key, fields in operations:
+            if operation == "set":
+                document = {**(fields or {}), "_id": key}
+                requests.append(pymongo.ReplaceOne({"_id": key}, document, upsert=True))
+            elif operation == "update":
+                update = {"$set": fields or {}}
+                requests.append(pymongo.UpdateOne({"_id": key}, update, upsert=True))
+            elif operation == "increment":
+                update = {"$inc": fields or {}}
+                requests.append(pymongo.UpdateOne({"_id": key}, update, upsert=True))
+            else:
+                requests.append(pymongo.DeleteOne({"_id": key}))
+        self.database[collection].bulk_write(requests, ordered=True)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+backends: dict[str, Callable[..., Backend]] = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+    "mongo": MongoBackend,
+}
 
 
 class Interface:
-    pass
+    """Async access to the bot's data, over a pluggable backend."""
+
+    def __init__(
+        self,
+        backend: Optional[Backend] = None,
+        pool_size: int = 4,
+        max_queue: int = 64,
+        timeout: Optional[float] = 5.0,
+        max_batch: int = 500,
+        buffer_size: int = 1000,
+        flush_interval: float = 5.0,
+    ) -> None:
+        self.backend = backend or MemoryBackend()
+        self.pool = OffloadPool(
+            "database", ThreadPoolExecutor, max_workers=pool_size, max_queue=max_queue
+        )
+        # Seconds before a call raises `asyncio.TimeoutError`, `None` for never
+        self.timeout = timeout
+        self.max_batch = max_batch
+        # Collection -> key -> the futures of the gets waiting for it
+        self.pending: dict[str, dict[Hashable, list[asyncio.Future]]] = {}
+        self.tasks: set[asyncio.Task] = set()
+        # Write-behind, for counters and activity written on every message
+        self.buffer = WriteBuffer(self, max_size=buffer_size, interval=flush_interval)
+        # Metrics
+        self.reads: int = 0
+        self.batches: int = 0
+        self.writes: int = 0
+        self.timeouts: int = 0
+
+    async def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        if not self.backend.blocking:
+            return function(*args)
+        return await self.pool.run(function, *args)
+
+    async def run(
+        self, timeout: Optional[float], function: Callable[..., Any], *args: Any
+    ) -> Any:
+        if not self.backend.blocking:
+            return function(*args)
+        # NOTE: A call that times out still finishes on its thread.
+        return await self.wait(self.call(function, *args), timeout)
+
+    async def wait(self, awaitable: Any, timeout: Optional[float]) -> Any:
+        try:
+            return await asyncio.wait_for(
+                awaitable, self.timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    # Reads
+    async def get(
+        self, collection: str, key: Hashable, timeout: Optional[float] = None
+    ) -> Optional[dict[str, Any]]:
+        """Get a document, or `None` if there is none."""
+        self.reads += 1
+        loop = asyncio.get_running_loop()
+        pending = self.pending.get(collection)
+        if pending is None:
+            pending = self.pending[collection] = {}
+            loop.call_soon(self.flush_reads, collection)
+        future = loop.create_future()
+        pending.setdefault(key, []).append(future)
+        return await self.wait(future, timeout)
+
+    def flush_reads(self, collection: str) -> None:
+        pending = self.pending.pop(collection, {})
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch):
+            batch = {key: pending[key] for key in keys[start : start + self.max_batch]}
+            task = asyncio.get_running_loop().create_task(
+                self.load_batch(collection, batch)
+            )
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def load_batch(
+        self, collection: str, batch: dict[Hashable, list[asyncio.Future]]
+    ) -> None:
+        self.batches += 1
+        # Each get waits with its own timeout.
+        try:
+            documents = await self.call(self.backend.get_many, collection, list(batch))
+        except Exception as exception:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exception)
+            return
+        for key, futures in batch.items():
+            document = documents.get(key)
+            for index, future in enumerate(futures):
+                if future.done():
+                    continue
+                # Gets of the same key each get their own copy.
+                if index > 0 and document is not None:
+                    future.set_result(deepcopy(document))
+                else:
+                    future.set_result(document)
+
+    async def get_many(
+        self,
+        collection: str,
+        keys: Iterable[Hashable],
+        timeout: Optional[float] = None,
+    ) -> dict[Hashable, dict[str, Any]]:
+        """Get the documents that exist out of `keys`, by key."""
+        keys = list(dict.fromkeys(keys))
+        self.reads += len(keys)
+        documents: dict[Hashable, dict[str, Any]] = {}
+        for start in range(0, len(keys), self.max_batch):
+            self.batches += 1
+            documents.update(
+                await self.run(
+                    timeout,
+                    self.backend.get_many,
+                    collection,
+                    keys[start : start + self.max_batch],
+                )
+            )
+        return documents
+
+    async def find(
+        self,
+        collection: str,
+        filter: Optional[dict[str, Any]] = None,
+        limit: int = 0,
+        timeout: Optional[float] = None,
+    ) -> list[dict[str, Any]]:
+        """Get the documents whose fields equal those in `filter` (at most
+        `limit` of them, if not 0)."""
+        return await self.run(timeout, self.backend.find, collection, filter, limit)
+
+    # Writes
+    async def bulk(
+        self,
+        collection: str,
+        operations: Iterable[tuple[str, Hashable, Optional[dict[str, Any]]]],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Apply writes (see `write_operations`) in order, in as few batches as
+        possible."""
+        operations = list(operations)
+        for operation, _, _ in operations:
+            if operation not in write_operations:
+                raise ValueError(
+                    f"`{operation}` is not a valid write.  Valid writes: "
+                    f"{', '.join(write_operations)}."
+                )
+        for start in range(0, len(operations), self.max_batch):
+            batch = operations[start : start + self.max_batch]
+            await self.run(timeout, self.backend.bulk_write, collection, batch)
+            self.writes += len(batch)
+
+    async def set(
+        self,
+        collection: str,
+        key: Hashable,
+        document: dict[str, Any],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Replace a document."""
+        await self.bulk(collection, [("set", key, document)], timeout)
+
+    async def update(
+        self,
+        collection: str,
+        key: Hashable,
+        fields: dict[str, Any],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Set some fields of a document."""
+        await self.bulk(collection, [("update", key, fields)], timeout)
+
+    async def increment(
+        self,
+        collection: str,
+        key: Hashable,
+        fields: dict[str, Any],
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Add to some (numeric) fields of a document."""
+        await self.bulk(collection, [("increment", key, fields)], timeout)
+
+    async def delete(
+        self, collection: str, key: Hashable, timeout: Optional[float] = None
+    ) -> None:
+        await self.bulk(collection, [("delete", key, None)], timeout)
+
+    async def close(self) -> None:
+        await self.buffer.close()
+        for task in tuple(self.tasks):
+            task.cancel()
+        self.pool.shutdown(wait=True)
+        self.backend.close()
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "reads": self.reads,
+            "batches": self.batches,
+            "writes": self.writes,
+            "timeouts": self.timeouts,
+            "pool": self.pool.metrics(),
+            "buffer": self.buffer.metrics(),
+        }
+
+
+class WriteBuffer:
+    """Holds increments and updates in memory, merged by document, and writes
+    them in bulk once `max_size` documents are pending or `interval` seconds
+    after the first pending write.  At most one interval of writes can be lost,
+    as the buffer is also flushed on disconnect and on close."""
+
+    def __init__(
+        self, interface: Interface, max_size: int = 1000, interval: float = 5.0
+    ) -> None:
+        self.interface = interface
+        self.max_size = max_size
+        self.interval = interval
+        # (collection, key) -> (fields to set, fields to increment)
+        self.pending: dict[
+            tuple[str, Hashable], tuple[dict[str, Any], dict[str, Any]]
+        ] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: set[asyncio.Task] = set()
+        self.lock: Optional[asyncio.Lock] = None
+        # Metrics
+        self.buffered: int = 0
+        self.flushes: int = 0
+        self.written: int = 0
+        self.failures: int = 0
+
+        self.tree = EventTree("WriteBuffer", persistent=True, priority=100)
+        self.tree.bind("on_disconnect", "FlushWrites")(self.flush)
+
+    def get_entry(
+        self, collection: str, key: Hashable
+    ) -> tuple[dict[str, Any], dict[str, Any]]:
+        entry = self.pending.get((collection, key))
+        if entry is None:
+            entry = self.pending[(collection, key)] = ({}, {})
+            if len(self.pending) == self.max_size:
+                self.schedule_flush()
+            elif self.timer is None:
+                loop = asyncio.get_running_loop()
+                self.timer = loop.call_later(self.interval, self.schedule_flush)
+        self.buffered += 1
+        return entry
+
+    def increment(self, collection: str, key: Hashable, **fields: Any) -> None:
+        """Add to some (numeric) fields of a document, eventually."""
+        sets, increments = self.get_entry(collection, key)
+        for field, amount in fields.items():
+            # Incrementing a field set in the same window adds to what is set.
+            if field in sets:
+                sets[field] += amount
+            else:
+                increments[field] = increments.get(field, 0) + amount
+
+    def update(self, collection: str, key: Hashable, **fields: Any) -> None:
+        """Set some fields of a document, eventually."""
+        sets, increments = self.get_entry(collection, key)
+        for field, value in fields.items():
+            increments.pop(field, None)
+            sets[field] = value
+
+    def schedule_flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        task = asyncio.get_running_loop().create_task(self.run_flush())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_flush(self) -> None:
+        # Nothing awaits a scheduled flush, so hand errors to the loop.
+        try:
+            await self.flush()
+        except Exception as exception:
+            asyncio.get_running_loop().call_exception_handler(
+                {"message": "Flushing buffered writes failed.", "exception": exception}
+            )
+
+    async def flush(self) -> None:
+        """Write everything pending now."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            self.flushes += 1
+            writes: dict[str, list[tuple[str, Hashable, Optional[dict[str, Any]]]]]
+            writes = {}
+            for (collection, key), (sets, increments) in pending.items():
+                operations = writes.setdefault(collection, [])
+                if sets:
+                    operations.append(("update", key, sets))
+                if increments:
+                    operations.append(("increment", key, increments))
+            # Written a batch at a time here, so that a failure only puts back
+            # the batches not yet written.
+            batch_size = self.interface.max_batch
+            written = 0
+            try:
+                for collection, operations in writes.items():
+                    for start in range(0, len(operations), batch_size):
+                        batch = operations[start : start + batch_size]
+                        await self.interface.bulk(collection, batch)
+                        written += len(batch)
+                        self.written += len(batch)
+            except Exception:
+                self.failures += 1
+                self.restore(self.get_unwritten(writes, written))
+                raise
+
+    @staticmethod
+    def get_unwritten(
+        writes: dict[str, list[tuple[str, Hashable, Optional[dict[str, Any]]]]],
+        written: int,
+    ) -> dict[tuple[str, Hashable], tuple[dict[str, Any], dict[str, Any]]]:
+        """The pending entries of every write after the first `written`."""
+        unwritten: dict[tuple[str, Hashable], tuple[dict[str, Any], dict[str, Any]]] = (
+            {}
+        )
+        for collection, operations in writes.items():
+            for operation, key, fields in operations:
+                if written > 0:
+                    written -= 1
+                    continue
+                sets, increments = unwritten.setdefault((collection, key), ({}, {}))
+                if operation == "update":
+                    sets.update(fields or {})
+                else:
+                    increments.update(fields or {})
+        return unwritten
+
+    def restore(
+        self,
+        pending: dict[tuple[str, Hashable], tuple[dict[str, Any], dict[str, Any]]],
+    ) -> None:
+        """Put back the writes of a failed flush, under any made since."""
+        # NOTE: A bulk write that timed out may still have been applied, in which
+        # case its increments will be applied twice.
+        for entry, (sets, increments) in pending.items():
+            newer = self.pending.get(entry)
+            if newer is not None:
+                newer_sets, newer_increments = newer
+                for field, amount in newer_increments.items():
+                    if field in sets:
+                        sets[field] += amount
+                    else:
+                        increments[field] = increments.get(field, 0) + amount
+                for field, value in newer_sets.items():
+                    increments.pop(field, None)
+                    sets[field] = value
+            self.pending[entry] = (sets, increments)
+
+    async def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        await self.flush()
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "pending": len(self.pending),
+            "buffered": self.buffered,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+        }
+
+
+def create_interface(
+    backend: str = "memory",
+    pool_size: int = 4,
+    max_queue: int = 64,
+    timeout: Optional[float] = 5.0,
+    max_batch: int = 500,
+    buffer_size: int = 1000,
+    flush_interval: float = 5.0,
+    **options: Any,
+) -> Interface:
+    """Create an interface from the `database` settings of `config.json`.
+    Options not listed are passed to the backend."""
+    if backend not in backends:
+        raise ValueError(
+            f"`{backend}` is not a valid database backend.  Valid backends: "
+            f"{', '.join(backends)}."
+        )
+    if backend == "mongo":
+        options["pool_size"] = pool_size
+    return Interface(
+        backends[backend](**options),
+        pool_size=pool_size,
+        max_queue=max_queue,
+        timeout=timeout,
+        max_batch=max_batch,
+        buffer_size=buffer_size,
+        flush_interval=flush_interval,
+    )
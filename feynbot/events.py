@@ -1,17 +1,227 @@
-from asyncio import iscoroutinefunction
+from asyncio import gather, iscoroutinefunction
+from functools import partial
 from types import ModuleType
-from typing import Any, Awaitable, Callable, Optional
-from inspect import currentframe
+from sys import intern
+from typing import Any, Awaitable, Callable, Hashable, Optional, Sequence
 
-from anytree import NodeMixin, RenderTree
+from anytree import NodeMixin, PreOrderIter, RenderTree
 
+from Feynbot.coalescing import Coalescer
 from Feynbot.constants import events_list
-from Feynbot.utility import check_kwargs
+from Feynbot.context import get_injector, get_parameters
+from Feynbot.executors import get_node_pool
+from Feynbot.instrumentation import instrument
+from Feynbot.utility import check_kwargs, pop_origin
 
 silenced_events = []
 
+# Flag bits, packed into `EventTree._flags`
+enabled_flag = 1 << 0
+persistent_flag = 1 << 1
+terminal_flag = 1 << 2
+concurrent_flag = 1 << 3
+always_flag = 1 << 4
+
+
+class DispatchPlan:
+    """A frozen, flattened list of the listeners that run when an event fires.
+    Priorities, `enabled`, `terminal` and `persistent` are all resolved when
+    the plan is compiled, so firing only has to walk the calls in order.
+
+    Consecutive `concurrent`, non-terminal listeners of the same priority are
+    compiled into a single stage and awaited together.
+
+    A listener raising stops the listeners after it, except `always` ones
+    (e.g. keeping a cache up to date), which run before the error is raised.
+
+    A plan only contains global listeners and the listeners scoped to `oids`.
+    Plans for other oids are compiled on demand by `route` and memoized."""
+
+    __slots__ = (
+        "event_name",
+        "events",
+        "calls",
+        "stages",
+        "terminal_index",
+        "always",
+        "steps",
+        "oids",
+        "scoped",
+    )
+
+    def __init__(
+        self,
+        event_name: str,
+        events: Sequence["Event"],
+        oids: tuple[int, ...] = (),
+    ) -> None:
+        calls = []
+        stages: list[list[tuple[Callable[..., Any], bool]]] = []
+        terminal_index: Optional[int] = None
+        terminated = False
+        always: list[int] = []
+        previous: Optional[Event] = None
+        scoped_oids: set[int] = set()
+        # `events` is presorted by priority
+        for event in events:
+            # Scoped to other objects:
+            if not event.is_global:
+                scoped_oids.update(event.oids)
+                if not any(oid in event.oids for oid in oids):
+                    continue
+            # Terminal and not persistent:
+            if terminated and not event.persistent:
+                continue
+            # Disabled, though a terminal listener still stops the rest:
+            if not event.enabled:
+                terminated = terminated or event.terminal
+                continue
+            if not callable(event.function):
+                raise IndexError(
+                    f"Event {event.event_name} from file {event.origin} not bound "
+                    f"to any valid function but was called."
+                )
+            call = event.get_call()
+            calls.append(call)
+            # Shares a stage with the previous listener:
+            if (
+                previous is not None
+                and previous.concurrent
+                and event.concurrent
+                and not previous.terminal
+                and not event.terminal
+                and previous.priority == event.priority
+            ):
+                stages[-1].append(call)
+            else:
+                stages.append([call])
+            previous = event
+            if event.terminal and terminal_index is None:
+                terminal_index = len(calls) - 1
+                terminated = True
+            # Only needed if another listener can raise before it.
+            if event.always and len(calls) > 1:
+                always.append(len(calls) - 1)
+        self.event_name: str = event_name
+        self.events: tuple[Event, ...] = tuple(events)
+        self.calls: tuple[tuple[Callable[..., Any], bool], ...] = tuple(calls)
+        self.terminal_index: Optional[int] = terminal_index
+        # Only keep stages when something actually runs concurrently.
+        self.stages: Optional[tuple[tuple[tuple[Callable[..., Any], bool], ...], ...]]
+        if len(stages) == len(calls):
+            self.stages = None
+        else:
+            self.stages = tuple(tuple(stage) for stage in stages)
+        self.always: tuple[int, ...] = tuple(always)
+        # The stages as the number of calls in each, to find where one raised
+        self.steps: tuple[int, ...] = tuple(len(stage) for stage in stages)
+        # Every oid with a scoped listener, only needed by the global plan.
+        self.oids: frozenset[int] = frozenset(scoped_oids) if not oids else frozenset()
+        self.scoped: dict[tuple[int, ...], DispatchPlan] = {}
+
+    def route(self, *oids: Optional[int]) -> "DispatchPlan":
+        """Get the plan for an event concerning `oids` (guild, channel, user)."""
+        matched = tuple(oid for oid in oids if oid in self.oids)
+        if not matched:
+            return self
+        plan = self.scoped.get(matched)
+        if plan is None:
+            plan = DispatchPlan(self.event_name, self.events, matched)
+            self.scoped[matched] = plan
+        return plan
+
+    async def __call__(self, *args: Any, **kwargs: Any) -> None:
+        if self.always:
+            return await self.call_always(args, kwargs)
+        if self.stages is None:
+            for function, is_coroutine in self.calls:
+                if is_coroutine:
+                    await function(*args, **kwargs)
+                else:
+                    function(*args, **kwargs)
+            return
+        for stage in self.stages:
+            if len(stage) == 1:
+                function, is_coroutine = stage[0]
+                if is_coroutine:
+                    await function(*args, **kwargs)
+                else:
+                    function(*args, **kwargs)
+                continue
+            await self.run_concurrently(stage, args, kwargs)
+
+    async def call_always(self, args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+        # As `__call__`, counting the calls made to know which `always`
+        # listeners are left if one raises.
+        made = 0
+        try:
+            for stage, step in zip(self.stages or self.calls, self.steps):
+                made += step
+                if step > 1:
+                    await self.run_concurrently(stage, args, kwargs)
+                    continue
+                function, is_coroutine = stage if self.stages is None else stage[0]
+                if is_coroutine:
+                    await function(*args, **kwargs)
+                else:
+                    function(*args, **kwargs)
+        except Exception:
+            for index in self.always:
+                if index < made:
+                    continue
+                function, is_coroutine = self.calls[index]
+                if is_coroutine:
+                    await function(*args, **kwargs)
+                else:
+                    function(*args, **kwargs)
+            raise
+
+    @staticmethod
+    async def run_concurrently(
+        stage: tuple[tuple[Callable[..., Any], bool], ...],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> None:
+        awaitables = []
+        try:
+            for function, is_coroutine in stage:
+                if is_coroutine:
+                    awaitables.append(function(*args, **kwargs))
+                else:
+                    function(*args, **kwargs)
+        except Exception:
+            # The coroutines already made still run, as they would have
+            # alongside the listener that raised.
+            await gather(*awaitables, return_exceptions=True)
+            raise
+        # Let the whole stage finish before surfacing the first error, so an
+        # exception still stops later stages like it does sequentially.
+        results = await gather(*awaitables, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
 
 class EventTree(NodeMixin):
+    # Listeners are generated per guild by the thousands, so nodes are slotted
+    # (anytree's `NodeMixin` still has a `__dict__`, but it's never filled).
+    __slots__ = (
+        "_NodeMixin__parent",
+        "_NodeMixin__children",
+        "name",
+        "origin",
+        "file_path",
+        "oids",
+        "index",
+        "plans",
+        "_flags",
+        "_priority",
+        "_executor",
+    )
+
     def __init__(
         self,
         node_name: Optional[str] = None,
@@ -21,35 +231,43 @@ class EventTree(NodeMixin):
         priority: Optional[int] = None,
         oid: Optional[int] = None,
         oids: Optional[list[int]] = None,
+        concurrent: Optional[bool] = None,
+        executor: Optional[str] = None,
+        always: Optional[bool] = None,
         **kwargs: Any,
     ) -> None:
         # Pre-initialization
-        self.events: dict[str, list[Event]] = {}
-        self.enabled: bool = True
-        self.persistent: bool = False
-        self.terminal: bool = False
-        self.priority: int = 0
-        self.oids: list[int] = list()  # CHANGE: `oids` can be made `set[int]`
+        # Only roots index their events and keep plans (see `register_event`).
+        self.index: Optional[dict[str, list[Event]]] = None
+        self.plans: Optional[dict[str, DispatchPlan]] = None
+        self._flags: int = enabled_flag
+        self._priority: int = 0
+        self._executor: Optional[str] = None
+        self.oids: tuple[int, ...] = ()
+        # Get file info from where this was defined
+        self.origin, self.file_path = pop_origin(kwargs)
         # Construct subobject
         super().__init__()
         # Check for a parent and inherit
         parent = kwargs.pop("parent", None)
         if parent:
             self.parent_to(parent, inherit=True)
-        # Get file info from where this was defined
-        caller_variables = currentframe().f_back.f_globals  # type: ignore
-        self.origin = kwargs.pop("origin", caller_variables["__name__"])
-        self.file_path = kwargs.pop("file_path", caller_variables["__file__"])
-        # Set (default) attributes
+        # Set (default) attributes.  Nothing is registered under a new node
+        # yet, so there are no plans to invalidate.
         self.name: str = node_name or self.origin
-        self.signature: str = self.name
-        # self.signature: str = self.name + f" [{self.file_path}]" # Extra info
-        self.enabled: bool = enabled or self.enabled
-        self.persistent: bool = persistent or self.persistent
-        self.terminal: bool = terminal or self.terminal
-        self.priority: int = priority or self.priority
-
-        self.is_global: bool = True
+        for flag, value in (
+            (enabled_flag, enabled),
+            (persistent_flag, persistent),
+            (terminal_flag, terminal),
+            (concurrent_flag, concurrent),
+            (always_flag, always),
+        ):
+            if value:
+                self._flags |= flag
+        self._priority = priority or self._priority
+        get_node_pool(executor)
+        self._executor = executor or self._executor
+
         if oids and oid:
             raise ValueError("Cannot have both `oid` and `oids`.")
         if oid:
@@ -58,18 +276,93 @@ class EventTree(NodeMixin):
             self.set_oids(*oids)
         check_kwargs(kwargs)
 
+    @property
+    def signature(self) -> str:
+        return self.name
+
+    # Flags (changing any of these invalidates compiled plans)
+    def set_flag(self, flag: int, value: bool) -> None:
+        if value:
+            self._flags |= flag
+        else:
+            self._flags &= ~flag
+        self.invalidate()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._flags & enabled_flag)
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self.set_flag(enabled_flag, value)
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self._flags & persistent_flag)
+
+    @persistent.setter
+    def persistent(self, value: bool) -> None:
+        self.set_flag(persistent_flag, value)
+
+    @property
+    def terminal(self) -> bool:
+        return bool(self._flags & terminal_flag)
+
+    @terminal.setter
+    def terminal(self, value: bool) -> None:
+        self.set_flag(terminal_flag, value)
+
+    @property
+    def priority(self) -> int:
+        return self._priority
+
+    @priority.setter
+    def priority(self, value: int) -> None:
+        self._priority = value
+        self.invalidate()
+
+    @property
+    def concurrent(self) -> bool:
+        return bool(self._flags & concurrent_flag)
+
+    @concurrent.setter
+    def concurrent(self, value: bool) -> None:
+        self.set_flag(concurrent_flag, value)
+
+    @property
+    def always(self) -> bool:
+        """Runs even if an earlier listener raised."""
+        return bool(self._flags & always_flag)
+
+    @always.setter
+    def always(self, value: bool) -> None:
+        self.set_flag(always_flag, value)
+
+    @property
+    def executor(self) -> Optional[str]:
+        """The pool (see `executors.node_pools`) sync functions run on."""
+        return self._executor
+
+    @executor.setter
+    def executor(self, value: Optional[str]) -> None:
+        get_node_pool(value)
+        self._executor = value
+        self.invalidate()
+
     # OID Methods
+    @property
+    def is_global(self) -> bool:
+        return len(self.oids) == 0
+
     def set_oids(self, *oids: int) -> None:
-        self.oids = list(oids)
-        self.is_global = len(self.oids) == 0
+        self.oids = tuple(dict.fromkeys(oids))
+        self.invalidate()
 
     def add_oids(self, *oids: int) -> None:
-        self.oids.extend([oid for oid in oids if oid not in self.oids])
-        self.is_global = len(self.oids) == 0
+        self.set_oids(*self.oids, *oids)
 
     def remove_oids(self, *oids: int) -> None:
-        self.oids = [oid for oid in self.oids if oid not in oids]
-        self.is_global = len(self.oids) == 0
+        self.set_oids(*[oid for oid in self.oids if oid not in oids])
 
     def bind(
         self,
@@ -79,17 +372,13 @@ class EventTree(NodeMixin):
         oids: Optional[list[int]] = None,
         **kwargs: Any,
     ) -> Callable[[Callable], Any]:
-        # Get file info from where this was defined
-        caller_variables = currentframe().f_back.f_globals  # type: ignore
-        origin = kwargs.pop("origin", caller_variables["__name__"])
-        file_path = kwargs.pop("file_path", caller_variables["__file__"])
-
+        origin, file_path = pop_origin(kwargs)
         event = Event(
             node_name=node_name,
             oid=oid,
             oids=oids,
-            origin=kwargs.get("origin", origin),
-            file_path=kwargs.get("file_path", file_path),
+            origin=origin,
+            file_path=file_path,
             parent=self,
             **kwargs,
         )
@@ -97,32 +386,122 @@ class EventTree(NodeMixin):
         return decorator
 
     def parent_to(self, parent: "EventTree", inherit: bool = True) -> None:
+        if self.parent is not None:
+            self.detach()
+        # A root's index holds everything under it, which moves to the new root.
+        events = self.flatten_index()
+        self.index = None
+        self.plans = None
         self.parent = parent
         if inherit:
             self.inherit_from(parent)
-        for events in self.events.values():
-            for event in events:
-                parent.register_event(event)
+        for event in events:
+            parent.register_event(event)
 
     def adopt_tree(self, child: "EventTree", inherit: bool = True) -> None:
         child.parent_to(self, inherit=inherit)
 
-    def register_event(self, event: "Event", recursive: bool = True) -> None:
+    def detach(self) -> None:
+        """Remove this tree (and its events) from its parent."""
+        parent = self.parent
+        if parent is None:
+            return
+        events = self.get_events()
+        for event in events:
+            parent.unregister_event(event)
+        self.parent = None
+        for event in events:
+            self.register_event(event)
+
+    def replace_tree(self, old: "EventTree") -> None:
+        """Put this tree in place of `old`, each of its events taking the place
+        (and so the order) of the event at the same position in `old`."""
+        parent = old.parent
+        if parent is None:
+            raise ValueError(f"Can't replace `{old}`, as it has no parent.")
+        root = parent.root
+        for old_event, event in zip(old.get_events(), self.get_events()):
+            root.replace_event(old_event, event)
+        old.parent = None
+        self.index = None
+        self.plans = None
+        self.parent = parent
+
+    # Index Methods
+    def register_event(self, event: "Event") -> None:
         event_name = event.event_name
         if event_name is None:
             raise ValueError("Event must have an event_name.")
-        if event_name not in self.events:
-            self.events[event_name] = list()
-        self.events[event_name].append(event)
-        self.sort(event_name)
-        if self.parent and recursive:
-            self.parent.register_event(event)
+        root = self.root
+        if root.index is None:
+            root.index = {}
+        if event_name not in root.index:
+            root.index[event_name] = list()
+        # Sorting is deferred until the event's plan is compiled.
+        root.index[event_name].append(event)
+        if root.plans is not None:
+            root.plans.pop(event_name, None)
+
+    def unregister_event(self, event: "Event") -> None:
+        event_name: str = event.event_name  # type: ignore
+        root = self.root
+        events = root.index.get(event_name) if root.index else None
+        if events is not None and event in events:
+            events.remove(event)
+            if len(events) == 0:
+                del root.index[event_name]  # type: ignore
+            if root.plans is not None:
+                root.plans.pop(event_name, None)
+
+    def replace_event(self, old: "Event", new: "Event") -> None:
+        """Put `new` in place of `old`, keeping its position in the order."""
+        event_name: str = old.event_name  # type: ignore
+        root = self.root
+        events = root.index.get(event_name) if root.index else None
+        if events is not None and old in events:
+            events[events.index(old)] = new
+            if root.plans is not None:
+                root.plans.pop(event_name, None)
+
+    def flatten_index(self) -> list["Event"]:
+        if self.index is None:
+            return []
+        return [event for events in self.index.values() for event in events]
+
+    def get_events(self) -> list["Event"]:
+        """Get every bound event in this tree, in tree order."""
+        return [
+            node
+            for node in PreOrderIter(self)
+            if isinstance(node, Event) and node.event_name is not None
+        ]
+
+    def get_coalescers(self) -> list[Coalescer]:
+        """Get the coalescers of every bound event in this tree."""
+        return [
+            event.coalescer
+            for event in self.get_events()
+            if event.coalescer is not None
+        ]
+
+    @property
+    def events(self) -> dict[str, list["Event"]]:
+        """The events in this tree by event name.  Only the root keeps these
+        indexed, so they're gathered for every other tree."""
+        if self.parent is None:
+            return self.index or {}
+        events: dict[str, list[Event]] = {}
+        for event in self.get_events():
+            if event.event_name not in events:
+                events[event.event_name] = list()  # type: ignore
+            events[event.event_name].append(event)  # type: ignore
+        return events
 
     def inherit_from(self, node: "EventTree") -> None:
-        self.enabled = node.enabled
-        self.persistent = node.persistent
-        self.terminal = node.terminal
-        self.priority = node.priority
+        self._flags = node._flags
+        self._priority = node._priority
+        self._executor = node._executor
+        # Invalidates plans for all of the above
         self.set_oids(*node.oids)
 
     def has(self, event_name: str) -> bool:
@@ -139,7 +518,35 @@ class EventTree(NodeMixin):
 
         self.events[event_name].sort(key=sort_key)
 
-    async def fire(self, event_name: str, *args: Any, **kwargs: Any) -> Any:
+    # Dispatch Plan Methods
+    def invalidate(self, event_name: Optional[str] = None) -> None:
+        """Drop compiled plans, which only the root keeps."""
+        root = self.root
+        if root.plans is None:
+            return
+        if event_name is None:
+            root.plans.clear()
+        else:
+            root.plans.pop(event_name, None)
+
+    def compile(self, event_name: Optional[str] = None) -> None:
+        """Compile dispatch plans ahead of time, rather than on first fire.
+        Subtrees don't keep plans, as only the root's are invalidated."""
+        if self.parent is not None:
+            return
+        if event_name is None:
+            for event_name in self.events:
+                self.compile(event_name)
+            return
+        self.sort(event_name)
+        if self.plans is None:
+            self.plans = {}
+        self.plans[event_name] = DispatchPlan(event_name, self.events[event_name])
+
+    def get_plan(self, event_name: str) -> DispatchPlan:
+        plan = self.plans.get(event_name) if self.plans else None
+        if plan is not None:
+            return plan
         # Not silenced and not found:
         if event_name not in silenced_events and not self.has(event_name):
             silenced_events.append(event_name)
@@ -149,18 +556,30 @@ class EventTree(NodeMixin):
             )
         # Silenced and not found:
         elif not self.has(event_name):
-            return
+            plan = DispatchPlan(event_name, [])
+            if self.parent is None:
+                if self.plans is None:
+                    self.plans = {}
+                self.plans[event_name] = plan
+            return plan
         # Found:
-        terminal_flag = False
-        # Run events in order (presorted by priority)
-        for event in self.events[event_name]:
-            # Terminal and not persistent:
-            if terminal_flag and not event.persistent:
-                continue
-            # Not terminal or persistent:
-            await event(*args, **kwargs)
-            if event.terminal:
-                terminal_flag = True
+        if self.parent is not None:
+            events = sorted(self.events[event_name], key=lambda event: -event.priority)
+            return DispatchPlan(event_name, events)
+        self.compile(event_name)
+        return self.plans[event_name]  # type: ignore
+
+    async def fire(
+        self,
+        event_name: str,
+        *args: Any,
+        oids: tuple[Optional[int], ...] = (),
+        **kwargs: Any,
+    ) -> Any:
+        plan = self.get_plan(event_name)
+        if plan.oids:
+            plan = plan.route(*oids)
+        await plan(*args, **kwargs)
 
     def __call__(self, event, *args: Any, **kwargs: Any) -> Any:
         """Call the event."""
@@ -179,6 +598,15 @@ class EventTree(NodeMixin):
 
 
 class Event(EventTree):
+    __slots__ = (
+        "event_name",
+        "function",
+        "is_coroutine",
+        "parameters",
+        "coalescer",
+        "own_executor",
+    )
+
     def __init__(
         self,
         node_name: Optional[str] = None,
@@ -188,12 +616,28 @@ class Event(EventTree):
         priority: Optional[int] = None,
         oid: Optional[int] = None,
         oids: Optional[list[int]] = None,
+        concurrent: Optional[bool] = None,
+        executor: Optional[str] = None,
+        always: Optional[bool] = None,
+        coalesce: Optional[Callable[..., Hashable]] = None,
+        window: float = 1.0,
+        batch: bool = False,
         **kwargs: Any,
     ) -> None:
-        # Get file info from where this was defined
-        caller_variables = currentframe().f_back.f_globals  # type: ignore
-        origin = kwargs.pop("origin", caller_variables["__name__"])
-        file_path = kwargs.pop("file_path", caller_variables["__file__"])
+        # Pre-initialization
+        self.event_name: Optional[str] = None
+        self.function: Optional[Callable[..., Optional[Awaitable[None]]]] = None
+        self.is_coroutine: bool = False
+        # The context attributes `function` takes
+        self.parameters: tuple[str, ...] = ()
+        # Passed for this event, rather than inherited from its tree
+        self.own_executor: Optional[str] = executor
+        # Coalescing (see `coalescing.py`)
+        self.coalescer: Optional[Coalescer] = None
+        if coalesce is not None:
+            key = get_injector(coalesce, get_parameters(coalesce))
+            self.coalescer = Coalescer(key, window=window, batch=batch)
+        origin, file_path = pop_origin(kwargs)
         # Construct node
         super().__init__(
             node_name=node_name,
@@ -203,15 +647,19 @@ class Event(EventTree):
             priority=priority,
             oid=oid,
             oids=oids,
-            origin=kwargs.get("origin", origin),
-            file_path=kwargs.get("file_path", file_path),
+            concurrent=concurrent,
+            executor=executor,
+            always=always,
+            origin=origin,
+            file_path=file_path,
             **kwargs,
         )
-        # Set attributes
-        self.signature = self.signature + " @"
-        self.event_name: Optional[str] = None
-        self.function: Optional[Callable[..., Optional[Awaitable[None]]]] = None
-        self.is_coroutine: bool
+
+    @property
+    def signature(self) -> str:
+        if self.event_name is None:
+            return f"{self.name} @"
+        return f"{self.name} @{self.priority} {self.event_name}"
 
     def bind(
         self,
@@ -240,15 +688,37 @@ class Event(EventTree):
                 )
             self.name = node_name or self.name or function.__name__
             self.is_coroutine = iscoroutinefunction(function)
+            self.parameters = get_parameters(function)
+            # A tree's executor only applies to its sync functions.
+            if self.is_coroutine and self.own_executor is not None:
+                raise ValueError(
+                    f"Event `{self.name}` from `{self.origin}` is a coroutine and "
+                    f"can't be run on the `{self.own_executor}` executor."
+                )
+            self.invalidate(event_name)
 
-        self.event_name = event_name
-        self.signature = self.signature + f"{self.priority} " + self.event_name
+        # Shared by every listener of the event, however it was loaded.
+        self.event_name = intern(event_name)
         self.register_event(self)
         return decorator
 
     def has(self, event_name: str) -> bool:
         return self.event_name == event_name
 
+    def get_call(self) -> tuple[Callable[..., Any], bool]:
+        """Get the callable to dispatch to and whether it must be awaited."""
+        pool = None if self.is_coroutine else get_node_pool(self.executor)
+        if pool is not None:
+            function = partial(pool.run, self.function)
+            call = get_injector(function, self.parameters), True
+        else:
+            call = get_injector(self.function, self.parameters), self.is_coroutine
+        call = instrument("event", self, call)
+        if self.coalescer is not None:
+            self.coalescer.bind(*call, self.event_name)
+            return self.coalescer.submit, False
+        return call
+
     async def fire(self, *args: Any, **kwargs: Any) -> None:
         # FIX: Currently, this will only fire the first event in the hierarchy.
         # of the same `event_name` as this overrides the `fire` method of `EventTree`
@@ -259,10 +729,11 @@ class Event(EventTree):
                 f"Event {self.event_name} from file {self.origin} not bound "
                 f"to any valid function but was called."
             )
-        if iscoroutinefunction(self.function):
-            await self.function(*args, **kwargs)
+        function, is_coroutine = self.get_call()
+        if is_coroutine:
+            await function(*args, **kwargs)
         else:
-            self.function(*args, **kwargs)
+            function(*args, **kwargs)
 
     def __call__(self, *args: Any, **kwargs: Any) -> Awaitable[None]:
         # CHANGE:  This can probably be removed to use the method from `EventTree`,
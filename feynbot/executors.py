@@ -0,0 +1,134 @@
+"""Bounded thread and process pools for running blocking code off of the event
+loop.  Synchronous events and commands bound with `executor="thread"` run on
+`thread_pool`, and CPU-heavy work can be sent to `process_pool`."""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+
+class OffloadPool:
+    """An executor with a limit on how much work may be queued on it.  Once
+    `max_workers + max_queue` calls are in flight, further calls wait for a
+    slot instead of piling up."""
+
+    def __init__(
+        self,
+        name: str,
+        executor_type: type[Executor],
+        max_workers: int = 4,
+        max_queue: int = 64,
+    ) -> None:
+        self.name = name
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        # Created on first use, so that they belong to the running loop.
+        self.executor: Optional[Executor] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        # Metrics
+        self.in_flight: int = 0
+        self.waiting: int = 0
+        self.peak_queued: int = 0
+        self.completed: int = 0
+        self.failed: int = 0
+
+    def configure(
+        self,
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+    ) -> None:
+        if self.executor is not None:
+            raise RuntimeError(
+                f"Cannot configure the `{self.name}` pool after it has started."
+            )
+        self.max_workers = max_workers or self.max_workers
+        self.max_queue = self.max_queue if max_queue is None else max_queue
+
+    @property
+    def queued(self) -> int:
+        """Calls submitted to the executor but not yet picked up by a worker."""
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self.executor is None:
+            self.executor = self.executor_type(max_workers=self.max_workers)
+            self.semaphore = asyncio.Semaphore(self.max_workers + self.max_queue)
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()  # type: ignore
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.executor, partial(function, *args, **kwargs)
+            )
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()  # type: ignore
+        self.completed += 1
+        return result
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "waiting": self.waiting,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+            self.semaphore = None
+
+
+thread_pool = OffloadPool("thread", ThreadPoolExecutor, max_workers=8, max_queue=256)
+process_pool = OffloadPool("process", ProcessPoolExecutor, max_workers=2, max_queue=32)
+
+# Pools that events and commands may be bound to with `executor=...`.  Whole
+# listeners can't run in `process_pool`, as their arguments (the bot, discord
+# objects) can't be pickled; send plain data there with `Feynbot.offload`.
+node_pools: dict[str, OffloadPool] = {"thread": thread_pool}
+
+
+def get_node_pool(executor: Optional[str]) -> Optional[OffloadPool]:
+    if executor is None:
+        return None
+    if executor not in node_pools:
+        raise ValueError(
+            f"`{executor}` is not a valid executor for events or commands.  Valid "
+            f"executors: {', '.join(node_pools)}."
+        )
+    return node_pools[executor]
+
+
+def configure(
+    thread_workers: Optional[int] = None,
+    thread_queue: Optional[int] = None,
+    process_workers: Optional[int] = None,
+    process_queue: Optional[int] = None,
+) -> None:
+    thread_pool.configure(thread_workers, thread_queue)
+    process_pool.configure(process_workers, process_queue)
+
+
+def metrics() -> dict[str, dict[str, int]]:
+    return {"thread": thread_pool.metrics(), "process": process_pool.metrics()}
+
+
+def shutdown(wait: bool = False) -> None:
+    thread_pool.shutdown(wait=wait)
+    process_pool.shutdown(wait=wait)
@@ -4,19 +4,61 @@ data from the other directories in this package."""
 
 # Load Folder -> Load Module -> Register -> Listen
 
+import asyncio
 import pathlib
 import importlib
-from typing import Callable, Optional
+from typing import Any, Callable, Optional
+
+import discord
 from discord import Interaction
 from discord import Object as DObject
 
 import discord.app_commands as app_commands
 from discord.app_commands import Command as DCommand
 
-from Feynbot.commands import CommandTree, get_command_trees
+from Feynbot import coalescing, instrumentation
+from Feynbot.command_sync import CommandSync
+from Feynbot.commands import Command, CommandTree, get_command_trees
+from Feynbot.context import Context
+from Feynbot.data_interface import Interface
 from Feynbot.events import EventTree, get_event_trees
-from Feynbot.utility import import_from_path
-from Feynbot.constants import events_list
+from Feynbot.logs import current_event
+from Feynbot.manifest import (
+    Manifest,
+    build_command_placeholders,
+    build_event_placeholders,
+    describe_command_trees,
+    describe_event_trees,
+    flatten_events,
+)
+from Feynbot.members import MemberChunker
+from Feynbot.message_cache import MessageCache
+from Feynbot.message_commands import MessageRouter
+from Feynbot.recording import Recorder
+from Feynbot.utility import file_digest, get_module_name, import_from_path
+from Feynbot.scheduler import Scheduler
+from Feynbot.settings import SettingsCache
+from Feynbot.constants import base_intents, event_intents, events_list, intent_names
+
+
+class SourceFile:
+    """An event or command file that has been loaded, and the trees it made."""
+
+    __slots__ = ("path", "mtime", "digest", "trees", "lazy")
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        trees: tuple[Any, ...],
+        digest: Optional[str] = None,
+        lazy: bool = False,
+    ) -> None:
+        self.path = path
+        self.mtime: int = path.stat().st_mtime_ns
+        self.digest: str = digest or file_digest(path)
+        self.trees = trees
+        # Registered from the manifest with placeholders, not yet imported.
+        self.lazy = lazy
 
 
 class Handler:
@@ -27,17 +69,56 @@ class Handler:
         bot,
         events_directory: str,
         commands_directory: str,
+        dispatch_queues: Optional[dict[str, dict[str, Any]]] = None,
+        manifest: Optional[str] = None,
+        command_hashes: Optional[str] = None,
+        database: Optional[Interface] = None,
+        settings: Optional[dict[str, Any]] = None,
+        message_cache: Optional[dict[str, Any]] = None,
+        members: Optional[dict[str, Any]] = None,
+        message_commands: Optional[dict[str, Any]] = None,
     ) -> None:
         self.events_directory = events_directory
         self.commands_directory = commands_directory
         self.bot = bot
         self.console = bot.console
+        # Injected into events and commands as `db`
+        self.db: Interface = database or Interface()
+        self.settings = SettingsCache(self.db, **(settings or {}))
+        self.event_files: dict[pathlib.Path, SourceFile] = {}
+        self.command_files: dict[pathlib.Path, SourceFile] = {}
+        self.manifest: Optional[Manifest] = Manifest(manifest) if manifest else None
         self.event_trees: EventTree = EventTree("Root")
+        # Trees of the handler's own listeners, rather than of event files
+        self.internal_trees: list[EventTree] = [self.settings.tree, self.db.buffer.tree]
+        # On by default from the bot, `message_cache=None` to disable it, as it
+        # keeps every recent message
+        self.message_cache: Optional[MessageCache] = None
+        if message_cache is not None:
+            self.message_cache = MessageCache(**message_cache)
+            self.internal_trees.append(self.message_cache.tree)
+        # Chunks guilds lazily (see `members.py`), if `discord.py` doesn't at startup
+        self.chunker: Optional[MemberChunker] = None
+        if members is not None:
+            self.chunker = MemberChunker(bot, **members)
+            self.internal_trees.append(self.chunker.tree)
+        # Text commands, from prefixed messages (see `message_commands.py`)
+        self.message_router: Optional[MessageRouter] = None
+        if message_commands is not None:
+            self.message_router = MessageRouter(self, **message_commands)
+            self.internal_trees.append(self.message_router.tree)
         self.command_trees: CommandTree = CommandTree("Root")
         self.dcommand_tree: app_commands.CommandTree = app_commands.CommandTree(
             bot,
             fallback_to_global=False,
         )
+        self.command_sync = CommandSync(self.dcommand_tree, command_hashes)
+        # Records dispatched events while set (see `recording.py`)
+        self.recorder: Optional[Recorder] = None
+        self.scheduler = Scheduler(
+            self.fire_event, self.handle_error, queues=dispatch_queues
+        )
+        coalescing.configure(on_error=self.handle_error)
 
         self.load_and_register_all()
         self.hook_events()
@@ -45,22 +126,191 @@ class Handler:
 
     # General Methods
     def load_and_register_all(self) -> None:
+        for tree in self.internal_trees:
+            tree.parent_to(self.event_trees, inherit=False)
         event_trees = self.load_event_trees()
         for tree in event_trees:
             tree.parent_to(self.event_trees, inherit=False)
+        self.event_trees.compile()
         command_trees = self.load_command_trees()
         for tree in command_trees:
             tree.parent_to(self.command_trees, inherit=False)
+        if self.manifest:
+            self.manifest.save()
+
+    def instrument(
+        self, enabled: bool = True, slow_threshold: Optional[float] = None
+    ) -> None:
+        """Enable or disable per-listener instrumentation (see
+        `instrumentation.py`).  Plans and commands' calls are recompiled, so
+        that listeners are wrapped with timing or unwrapped."""
+        instrumentation.configure(enabled=enabled, slow_threshold=slow_threshold)
+        self.event_trees.invalidate()
+        self.event_trees.compile()
+        self.command_trees.invalidate()
 
-    def reload_all(self) -> None:
+    def start_recording(self, path: str, anonymise: bool = False) -> None:
+        """Append every event dispatched from now on to a recording, which
+        `recording.replay` can fire again offline."""
+        self.stop_recording()
+        self.recorder = Recorder(path, anonymise=anonymise)
+
+    def stop_recording(self) -> None:
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    async def reload_all(self) -> None:
+        """Reload the changed event and command files, and sync the commands
+        of the guilds they changed."""
         self.reload_events()
-        self.reload_commands()
+        scopes = self.reload_commands()
+        if scopes:
+            await self.sync_commands(
+                *(None if gid is None else DObject(id=gid) for gid in scopes)
+            )
 
     def reload_events(self) -> None:
-        pass
+        """Reload only the event files that were added, changed, or removed."""
+        changed, removed = self.find_changes(self.events_directory, self.event_files)
+        # Imported before anything is detached, so a file that fails to import
+        # keeps its previous listeners.
+        swaps = [
+            (self.event_files.pop(path, None), ()) for path in removed
+        ] + self.import_changes(changed, self.event_files, self.load_event_file)
+        affected: set[str] = set()
+        for previous, trees in swaps:
+            for tree in previous.trees if previous else ():
+                affected.update(tree.events)
+                # Held calls are delivered, rather than dropped or fired later.
+                for coalescer in tree.get_coalescers():
+                    coalescer.flush_all()
+                tree.detach()
+            for tree in trees:
+                affected.update(tree.events)
+                tree.parent_to(self.event_trees, inherit=False)
+        for event_name in affected:
+            if self.event_trees.has(event_name):
+                self.event_trees.compile(event_name)
+        if affected:
+            self.hook_events()
+        self.forget_files(removed)
 
-    def reload_commands(self) -> None:
-        pass
+    def reload_commands(self) -> set[Optional[int]]:
+        """Reload only the command files that were added, changed, or removed.
+        Returns the guild IDs (`None` being global) that need to be synced."""
+        changed, removed = self.find_changes(
+            self.commands_directory, self.command_files
+        )
+        sources = dict(self.command_files)
+        swaps = [
+            (self.command_files.pop(path, None), ()) for path in removed
+        ] + self.import_changes(changed, self.command_files, self.load_command_file)
+        # Every old tree is unhooked before any new one is hooked, so commands
+        # can move between files.
+        previous_trees = [
+            tree
+            for previous, _ in swaps
+            for tree in (previous.trees if previous else ())
+        ]
+        trees = [tree for _, new_trees in swaps for tree in new_trees]
+        self.unhook_trees(previous_trees)
+        hooked: list[Command] = []
+        try:
+            self.hook_trees(trees, hooked)
+        except Exception as exception:
+            # Rolled back to the previous version of every file.  Only what was
+            # hooked is unhooked, as a conflict may be with an unchanged file.
+            for command in hooked:
+                self.unhook_command(command)
+            for tree in trees:
+                tree.detach()
+            self.hook_trees(previous_trees)
+            self.command_files.clear()
+            self.command_files.update(sources)
+            self.bot.error(f"Couldn't reload the commands, rolled back: {exception!r}")
+            return set()
+        if self.message_router is not None:
+            self.message_router.invalidate()
+        self.forget_files(removed)
+        scopes: set[Optional[int]] = set()
+        for tree in previous_trees + trees:
+            for command in tree:
+                scopes.update(command.gids or (None,))
+        return scopes
+
+    def hook_trees(
+        self, trees: list[CommandTree], hooked: Optional[list[Command]] = None
+    ) -> None:
+        for tree in trees:
+            tree.parent_to(self.command_trees, inherit=False)
+            for command in tree:
+                self.hook_command(command)
+                if hooked is not None:
+                    hooked.append(command)
+
+    def unhook_trees(self, trees: list[CommandTree]) -> None:
+        for tree in trees:
+            for command in tree:
+                self.unhook_command(command)
+            tree.detach()
+
+    def import_changes(
+        self,
+        changed: list[pathlib.Path],
+        files: dict[pathlib.Path, SourceFile],
+        load: Callable[[pathlib.Path], tuple],
+    ) -> list[tuple[Optional[SourceFile], tuple]]:
+        """Load the changed files, as (previous source, new trees).  Files that
+        fail to import are skipped, and keep their previous source."""
+        swaps = []
+        for path in changed:
+            previous = files.get(path)
+            try:
+                trees = load(path)
+            except Exception as exception:
+                if previous is not None:
+                    files[path] = previous
+                self.bot.error(
+                    f"Couldn't reload `{path}`, keeping its previous version: "
+                    f"{exception!r}"
+                )
+                continue
+            swaps.append((previous, trees))
+        return swaps
+
+    def forget_files(self, removed: list[pathlib.Path]) -> None:
+        if self.manifest is None:
+            return
+        for path in removed:
+            self.manifest.remove(path)
+        self.manifest.save()
+
+    def find_changes(
+        self, directory: str, files: dict[pathlib.Path, SourceFile]
+    ) -> tuple[list[pathlib.Path], list[pathlib.Path]]:
+        """Get the files in `directory` that are new or whose contents changed,
+        and the previously loaded files that no longer exist."""
+        changed = []
+        seen = set()
+        for path in pathlib.Path(directory).rglob("*.py"):
+            if not path.is_file():
+                continue
+            seen.add(path)
+            source = files.get(path)
+            if source is None:
+                changed.append(path)
+                continue
+            mtime = path.stat().st_mtime_ns
+            if mtime == source.mtime:
+                continue
+            # Touched, but possibly not changed:
+            if file_digest(path) != source.digest:
+                changed.append(path)
+            else:
+                source.mtime = mtime
+        removed = [path for path in files if path not in seen]
+        return changed, removed
 
     # Event Methods
     def load_event_trees(self) -> tuple[EventTree]:
@@ -68,98 +318,243 @@ class Handler:
         for path in pathlib.Path(self.events_directory).rglob("*.py"):
             if not path.is_file():
                 continue
-            module = import_from_path(str(path))
-            trees = get_event_trees(module)
-            if len(trees) == 0:
-                self.bot.warn(f"Module `{module}` has no event trees.")
-                continue
-            all_trees += trees
+            all_trees += self.load_event_file(path)
         return tuple(all_trees)
 
+    def load_event_file(self, path: pathlib.Path) -> tuple[EventTree]:
+        digest = file_digest(path)
+        entry = self.manifest.get(path, digest) if self.manifest else None
+        if entry is not None:
+            trees = build_event_placeholders(
+                entry,
+                get_module_name(path),
+                str(path),
+                lambda tree, event: self.get_event_stub(path, tree, event),
+            )
+            self.event_files[path] = SourceFile(path, trees, digest, lazy=True)
+            return trees
+        module = import_from_path(str(path))
+        trees = get_event_trees(module)
+        self.event_files[path] = SourceFile(path, trees, digest)
+        if self.manifest:
+            self.manifest.set(path, digest, describe_event_trees(trees))
+        if len(trees) == 0:
+            self.bot.warning(f"Module `{module}` has no event trees.")
+        return trees
+
+    def get_event_stub(
+        self, path: pathlib.Path, tree_index: int, event_index: int
+    ) -> Callable:
+        async def lazy_event(context: Context) -> None:
+            source = self.event_files[path]
+            if source.lazy:
+                self.import_lazy_event_file(source)
+            event = flatten_events(source.trees[tree_index])[event_index]
+            await event.fire(context)
+
+        return lazy_event
+
+    def import_lazy_event_file(self, source: SourceFile) -> None:
+        """Import a file registered from the manifest, putting its events in
+        place of the placeholders (keeping their order)."""
+        module = import_from_path(str(source.path))
+        trees = get_event_trees(module)
+        for placeholder_tree, tree in zip(source.trees, trees):
+            tree.replace_tree(placeholder_tree)
+        source.trees = trees
+        source.lazy = False
+
     def hook_events(self) -> None:
+        """Hook the events that have listeners, so that `discord.py` doesn't
+        dispatch the rest at all."""
+
         def hook(self, event_name) -> Callable:
             async def handler(*args, **kwargs) -> None:
-                await self.fire_event(event_name, *args, **kwargs)
+                if self.recorder is not None:
+                    self.recorder.record(event_name, args, kwargs)
+                await self.scheduler.submit(event_name, *args, **kwargs)
 
             handler.__name__ = event_name + "_event_hook"
             return handler
 
         for event in events_list:
-            # TODO: Throw error if an event is enabled but the intent is not.
+            if not self.event_trees.has(event):
+                # Unhook events whose listeners were all removed.
+                if event in vars(self):
+                    delattr(self, event)
+                continue
             setattr(self, event, hook(self, event))
+        self.check_intents()
         return
 
+    def get_required_intents(self) -> discord.Intents:
+        """Get the minimal intents needed by the events that have listeners."""
+        intents = discord.Intents.none()
+        for intent in base_intents:
+            setattr(intents, intent, True)
+        for event in self.event_trees.events:
+            for intent in event_intents.get(event, ()):
+                setattr(intents, intent, True)
+        return intents
+
+    def check_intents(self) -> None:
+        requested: discord.Intents = self.bot.intents
+        required = self.get_required_intents()
+        missing = []
+        unused = []
+        for intent in intent_names:
+            if getattr(required, intent) and not getattr(requested, intent):
+                missing.append(intent)
+            elif getattr(requested, intent) and not getattr(required, intent):
+                unused.append(intent)
+        if missing:
+            self.bot.warning(
+                f"Intents `{', '.join(missing)}` are disabled, but events that "
+                f"need them have listeners.  These events won't fire."
+            )
+        if unused:
+            self.bot.warning(
+                f"Intents `{', '.join(unused)}` are enabled, but no listener "
+                f"needs them.  Consider disabling them in `intents.json`."
+            )
+
+    async def close_coalescers(self) -> None:
+        """Deliver every coalesced call still held (see `coalescing.py`)."""
+        coalescers = self.event_trees.get_coalescers()
+        await asyncio.gather(*(coalescer.close() for coalescer in coalescers))
+
+    async def handle_error(self, event_name: str, *args, **kwargs) -> None:
+        await self.bot.on_error(event_name, *args, **kwargs)
+
     async def fire_event(self, event_name: str, *args, **kwargs) -> None:
         # TODO: Impement checking, permissions, overrides
-        # TODO: Construct context, pass to event, etc.
-        raw = {
-            "args": args,
-            **kwargs,
-        }
-        kwargs = {
-            "context": None,
-            "bot": self.bot,
-            "db": None,
-            "raw": raw,
-        }
-        await self.event_trees(event_name, **kwargs)
+        # Everything but the arguments is resolved only if a listener asks.
+        context = Context(self.bot, event_name, args, kwargs, self.db)
+        plan = self.event_trees.get_plan(event_name)
+        # Only look for IDs when something is scoped to this event.
+        if plan.oids:
+            plan = plan.route(*context.oids)
+        # For sampling what's logged by event (see `logs.py`)
+        token = current_event.set(event_name)
+        try:
+            await plan(context)
+        finally:
+            current_event.reset(token)
         return
 
     # Command Methods
     def load_command_trees(self) -> tuple[CommandTree]:
         all_trees = []
         for path in pathlib.Path(self.commands_directory).rglob("*.py"):
-            module = import_from_path(str(path))
-            trees = get_command_trees(module)
-            if len(trees) == 0:
-                self.bot.warn(f"Module `{module}` has no command trees.")
-                continue
-            all_trees += trees
+            all_trees += self.load_command_file(path)
         return tuple(all_trees)
 
+    def load_command_file(self, path: pathlib.Path) -> tuple[CommandTree]:
+        digest = file_digest(path)
+        entry = self.manifest.get(path, digest) if self.manifest else None
+        if entry is not None:
+            trees = build_command_placeholders(
+                entry,
+                get_module_name(path),
+                str(path),
+                lambda tree, command: self.get_command_stub(path, tree, command),
+            )
+            self.command_files[path] = SourceFile(path, trees, digest, lazy=True)
+            return trees
+        module = import_from_path(str(path))
+        trees = get_command_trees(module)
+        self.command_files[path] = SourceFile(path, trees, digest)
+        if self.manifest:
+            self.manifest.set(path, digest, describe_command_trees(trees))
+        if len(trees) == 0:
+            self.bot.warning(f"Module `{module}` has no command trees.")
+        return trees
+
+    def get_command_stub(
+        self, path: pathlib.Path, tree_index: int, command_index: int
+    ) -> Callable:
+        async def lazy_command(context: Context) -> None:
+            source = self.command_files[path]
+            if source.lazy:
+                self.import_lazy_command_file(source)
+            command = tuple(source.trees[tree_index])[command_index]
+            await command.fire(context)
+
+        return lazy_command
+
+    def import_lazy_command_file(self, source: SourceFile) -> None:
+        """Import a file registered from the manifest, putting its commands in
+        place of the placeholders.  The `discord.py` commands already match."""
+        module = import_from_path(str(source.path))
+        trees = get_command_trees(module)
+        for tree in source.trees:
+            tree.detach()
+        for tree in trees:
+            tree.parent_to(self.command_trees, inherit=False)
+        source.trees = trees
+        source.lazy = False
+
+    async def warm_up(self, delay: float = 0) -> None:
+        """Import every file still registered from the manifest, one at a time
+        so as not to hold up the event loop."""
+        await asyncio.sleep(delay)
+        for source in tuple(self.event_files.values()):
+            if source.lazy:
+                self.import_lazy_event_file(source)
+                await asyncio.sleep(0)
+        for source in tuple(self.command_files.values()):
+            if source.lazy:
+                self.import_lazy_command_file(source)
+                await asyncio.sleep(0)
+
     def hook_commands(self) -> None:
+        print(repr(self.command_trees))
+        for command in self.command_trees:
+            self.hook_command(command)
+        return
+
+    def hook_command(self, command: Command) -> None:
         def hook(self, command_name) -> Callable:
             async def handler(interaction: Interaction) -> None:
-                # NOTE: Will need to pass Interaction or make a Context
                 self.log(f"Command `{command_name}` fired.")
-                await self.fire_command(command_name)
+                await self.fire_command(command_name, interaction)
 
             handler.__name__ = command_name + "_command_hook"
             return handler
 
-        print(repr(self.command_trees))
-        for command in self.command_trees:
-            # FIX: Currently, there are subtle errors, such as when description
-            # is an empty string.  These need to raise an exception.
-            if command.initialized() is False:
-                raise ValueError(f"Command `{command.name}` is not initialized.")
-            self.dcommand_tree.command(
-                name=command.command_name,
-                description=command.description,
-                guilds=command.get_gid_snowflakes(),
-            )(hook(self, command.name))
-        return
+        # FIX: Currently, there are subtle errors, such as when description
+        # is an empty string.  These need to raise an exception.
+        if command.initialized() is False:
+            raise ValueError(f"Command `{command.name}` is not initialized.")
+        self.dcommand_tree.command(
+            name=command.command_name,
+            description=command.description,
+            guilds=command.get_gid_snowflakes(),
+        )(hook(self, command.command_name))
 
-    async def sync_commands(self, *guilds: Optional[DObject]) -> None:
+    def unhook_command(self, command: Command) -> None:
+        for guild in command.get_gid_snowflakes() or (None,):
+            self.dcommand_tree.remove_command(
+                command.command_name, guild=guild  # type: ignore
+            )
+
+    async def sync_commands(
+        self, *guilds: Optional[DObject], force: bool = False
+    ) -> list[Optional[DObject]]:
+        """Sync the commands of the given guilds (`None` or no guilds being
+        global), skipping any whose commands haven't changed since."""
         if len(guilds) == 0:
-            await self.dcommand_tree.sync()
-            return
-        for guild in guilds:
-            await self.dcommand_tree.sync(guild=guild)
-        return
+            guilds = (None,)
+        return await self.command_sync.sync(*guilds, force=force)
 
     async def fire_command(self, command_name: str, *args, **kwargs) -> None:
         # TODO: Impement checking, permissions, overrides
-        # TODO: Construct context, pass to event, etc.
-        raw = {
-            "args": args,
-            **kwargs,
-        }
-        kwargs = {
-            "context": None,
-            "bot": self.bot,
-            "db": None,
-            "raw": raw,
-        }
-        await self.command_trees(command_name, **kwargs)
+        context = Context(self.bot, command_name, args, kwargs, self.db)
+        # Guild overrides take precedence over the global command.
+        gid = getattr(args[0], "guild_id", None) if args else None
+        token = current_event.set(command_name)
+        try:
+            await self.command_trees(command_name, context, gid=gid)
+        finally:
+            current_event.reset(token)
         return
@@ -0,0 +1,260 @@
+"""Per-listener instrumentation, to find which event or command file slows the
+bot down.  Every listener's calls, errors, slow calls and latency histogram
+are recorded under its signature and origin, and can be exported in the
+Prometheus text format.
+
+Listeners are only wrapped with timing when their calls are built, and only
+while instrumentation is enabled, so when it's disabled, dispatch is exactly
+as it would be without it.  Compiled plans must be recompiled after toggling
+it (see `Handler.instrument`)."""
+
+import asyncio
+import os
+import pathlib
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Callable, Optional
+
+# Set with `configure`
+active: bool = False
+# Seconds after which a call counts as slow
+threshold: float = 0.1
+# Upper bounds of the latency histogram buckets, in seconds
+buckets: tuple[float, ...] = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+)
+
+
+class ListenerStats:
+    """What has been recorded for a single listener."""
+
+    __slots__ = (
+        "kind",
+        "signature",
+        "origin",
+        "calls",
+        "errors",
+        "slow_calls",
+        "total_time",
+        "max_time",
+        "counts",
+    )
+
+    def __init__(self, kind: str, signature: str, origin: str) -> None:
+        self.kind = kind
+        self.signature = signature
+        self.origin = origin
+        self.calls: int = 0
+        self.errors: int = 0
+        self.slow_calls: int = 0
+        self.total_time: float = 0.0
+        self.max_time: float = 0.0
+        # Calls per bucket, not cumulative, the last being past every bound
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.counts[bisect_left(buckets, elapsed)] += 1
+        if failed:
+            self.errors += 1
+        if elapsed > threshold:
+            self.slow_calls += 1
+            slow_calls.append((time.time(), self.kind, self.signature, elapsed))
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "signature": self.signature,
+            "origin": self.origin,
+            "calls": self.calls,
+            "errors": self.errors,
+            "slow_calls": self.slow_calls,
+            "mean_time": self.mean_time,
+            "max_time": self.max_time,
+        }
+
+
+# (kind, signature, origin) -> stats, kept across reloads of the same listener
+stats: dict[tuple[str, str, str], ListenerStats] = {}
+# The latest slow calls, as (timestamp, kind, signature, seconds)
+slow_calls: deque[tuple[float, str, str, float]] = deque(maxlen=100)
+
+
+def configure(
+    enabled: Optional[bool] = None,
+    slow_threshold: Optional[float] = None,
+) -> None:
+    global active, threshold
+    if enabled is not None:
+        active = enabled
+    if slow_threshold is not None:
+        threshold = slow_threshold
+
+
+def get_stats(kind: str, signature: str, origin: str) -> ListenerStats:
+    key = (kind, signature, origin)
+    listener = stats.get(key)
+    if listener is None:
+        listener = ListenerStats(kind, signature, origin)
+        stats[key] = listener
+    return listener
+
+
+def instrument(
+    kind: str, node: Any, call: tuple[Callable[..., Any], bool]
+) -> tuple[Callable[..., Any], bool]:
+    """Wrap a listener's call (see `Event.get_call`) with timing, if enabled."""
+    if not active:
+        return call
+    function, is_coroutine = call
+    listener = get_stats(kind, node.signature, str(node.origin))
+    perf_counter = time.perf_counter
+
+    if is_coroutine:
+
+        async def timed_coroutine(*args: Any, **kwargs: Any) -> Any:
+            start = perf_counter()
+            try:
+                result = await function(*args, **kwargs)
+            except Exception:
+                listener.record(perf_counter() - start, True)
+                raise
+            listener.record(perf_counter() - start, False)
+            return result
+
+        return timed_coroutine, True
+
+    def timed(*args: Any, **kwargs: Any) -> Any:
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            listener.record(perf_counter() - start, True)
+            raise
+        listener.record(perf_counter() - start, False)
+        return result
+
+    return timed, False
+
+
+def reset() -> None:
+    stats.clear()
+    slow_calls.clear()
+
+
+def metrics() -> list[dict[str, Any]]:
+    return [listener.metrics() for listener in stats.values()]
+
+
+def summarize(count: int = 10, key: str = "total_time") -> str:
+    """Describe the `count` listeners that took the most time (or had the most
+    of `key`), and the latest slow calls."""
+    if not active:
+        return "Instrumentation is disabled."
+    listeners = sorted(
+        stats.values(), key=lambda listener: getattr(listener, key), reverse=True
+    )
+    lines = [f"{'calls':>8} {'errors':>6} {'slow':>5} {'mean ms':>8} {'max ms':>8}"]
+    for listener in listeners[:count]:
+        lines.append(
+            f"{listener.calls:>8} {listener.errors:>6} {listener.slow_calls:>5} "
+            f"{listener.mean_time * 1e3:>8.2f} {listener.max_time * 1e3:>8.2f} "
+            f"{listener.kind} {listener.signature} ({listener.origin})"
+        )
+    if slow_calls:
+        lines.append(f"Latest slow calls (over {threshold * 1e3:.0f} ms):")
+        for timestamp, kind, signature, elapsed in tuple(slow_calls)[-count:]:
+            moment = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            lines.append(f"{moment} {elapsed * 1e3:>8.2f} ms {kind} {signature}")
+    return "\n".join(lines)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(components: Optional[dict[str, Optional[dict[str, Any]]]] = None) -> str:
+    """Render every listener's metrics in the Prometheus text format, and the
+    numeric metrics of `components` as gauges (e.g. `feynbot_outbound_depth`)."""
+    families: dict[str, list[str]] = {
+        "calls_total": [],
+        "errors_total": [],
+        "slow_calls_total": [],
+        "duration_seconds": [],
+    }
+    for listener in tuple(stats.values()):
+        labels = (
+            f'kind="{listener.kind}",signature="{escape(listener.signature)}",'
+            f'origin="{escape(listener.origin)}"'
+        )
+        families["calls_total"].append(f"{{{labels}}} {listener.calls}")
+        families["errors_total"].append(f"{{{labels}}} {listener.errors}")
+        families["slow_calls_total"].append(f"{{{labels}}} {listener.slow_calls}")
+        histogram = families["duration_seconds"]
+        cumulative = 0
+        for bound, count in zip(buckets, listener.counts):
+            cumulative += count
+            histogram.append(f'_bucket{{{labels},le="{bound}"}} {cumulative}')
+        histogram.append(f'_bucket{{{labels},le="+Inf"}} {listener.calls}')
+        histogram.append(f"_sum{{{labels}}} {listener.total_time}")
+        histogram.append(f"_count{{{labels}}} {listener.calls}")
+    descriptions = {
+        "calls_total": ("counter", "Calls to each event or command listener."),
+        "errors_total": ("counter", "Calls that raised an exception."),
+        "slow_calls_total": ("counter", f"Calls over {threshold} seconds."),
+        "duration_seconds": ("histogram", "Time spent in each listener."),
+    }
+    lines = []
+    for family, samples in families.items():
+        kind, description = descriptions[family]
+        name = f"feynbot_listener_{family}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines += [name + sample for sample in samples]
+    for component, values in (components or {}).items():
+        for metric, value in (values or {}).items():
+            if isinstance(value, (int, float)):
+                name = f"feynbot_{component}_{metric}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write(
+    path: str, components: Optional[dict[str, Optional[dict[str, Any]]]] = None
+) -> None:
+    """Write the metrics to a file, e.g. for node_exporter's textfile collector.
+    Written to a temporary file first, so that it's never read half written."""
+    target = pathlib.Path(path)
+    temporary = target.with_name(target.name + ".tmp")
+    temporary.write_text(render(components), encoding="utf-8")
+    os.replace(temporary, target)
+
+
+async def export(
+    path: str,
+    interval: float = 15.0,
+    collect: Optional[Callable[[], dict[str, Optional[dict[str, Any]]]]] = None,
+) -> None:
+    """Write the metrics to `path` every `interval` seconds, until cancelled,
+    with the components' metrics from `collect`, if given."""
+    while True:
+        await asyncio.sleep(interval)
+        write(path, collect() if collect else None)
@@ -0,0 +1,280 @@
+"""A non-blocking logging pipeline.  Logging on the event loop only builds a
+small record and queues it; a background thread formats queued records and
+writes them in batches, so a slow terminal or pipe never blocks the loop.
+
+Records below `level` are dropped before anything is built, and records can
+be sampled by level or by the event being dispatched (e.g. only 1% of what's
+logged while handling `on_interaction`).  Rich is the development sink, and
+JSON lines the production one.  When the queue is full, records are dropped
+rather than waited for."""
+
+import atexit
+import datetime
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import IO, Any, Optional
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+level_names = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+level_styles = {DEBUG: "dim", INFO: "", WARNING: "bold dark_orange", ERROR: "bold red"}
+
+# The event or command being dispatched, set by the handler
+current_event: ContextVar[Optional[str]] = ContextVar("current_event", default=None)
+
+# Rich's markup tags, stripped from JSON output
+markup_pattern = re.compile(r"\[([a-z#/@][^[]*?)\]")
+
+
+def get_level(level: Any) -> int:
+    if isinstance(level, int):
+        return level
+    for number, name in level_names.items():
+        if name == str(level).lower():
+            return number
+    raise ValueError(
+        f"`{level}` is not a valid log level.  Valid levels: "
+        f"{', '.join(level_names.values())}."
+    )
+
+
+class LogRecord:
+    __slots__ = ("time", "level", "message", "event", "file", "line", "fields")
+
+    def __init__(
+        self,
+        time: float,
+        level: int,
+        message: str,
+        event: Optional[str],
+        file: Optional[str],
+        line: Optional[int],
+        fields: dict[str, Any],
+    ) -> None:
+        self.time = time
+        self.level = level
+        self.message = message
+        self.event = event
+        self.file = file
+        self.line = line
+        self.fields = fields
+
+    @property
+    def origin(self) -> str:
+        if self.file is None:
+            return ""
+        return f"{os.path.basename(self.file)}:{self.line}"
+
+
+class JSONSink:
+    """Writes records as JSON lines, to a file or a stream."""
+
+    def __init__(self, path: Optional[str] = None, stream: Optional[IO] = None):
+        # Only files opened here are closed here.
+        self.owned = path is not None
+        self.stream = open(path, "a", encoding="utf-8") if path else stream
+        if self.stream is None:
+            self.stream = sys.stdout
+
+    def write(self, records: list[LogRecord]) -> None:
+        lines = []
+        for record in records:
+            entry = {
+                "time": datetime.datetime.fromtimestamp(record.time).isoformat(),
+                "level": level_names.get(record.level, record.level),
+                "message": markup_pattern.sub("", record.message),
+            }
+            if record.event:
+                entry["event"] = record.event
+            if record.file:
+                entry["origin"] = record.origin
+            entry.update(record.fields)
+            lines.append(json.dumps(entry, default=str))
+        self.stream.write("\n".join(lines) + "\n")  # type: ignore
+        self.stream.flush()  # type: ignore
+
+    def close(self) -> None:
+        if self.owned:
+            self.stream.close()  # type: ignore
+
+
+class RichSink:
+    """Writes records to a rich console, laid out like `Console.log`."""
+
+    def __init__(self, console: Any) -> None:
+        self.console = console
+
+    def write(self, records: list[LogRecord]) -> None:
+        from rich.markup import escape
+
+        # Rendered as one write on exit
+        with self.console:
+            for record in records:
+                message = record.message
+                style = level_styles.get(record.level)
+                if style:
+                    label = level_names[record.level].upper()
+                    message = f"[{style}]{label}: {message}[/{style}]"
+                if record.fields:
+                    fields = " ".join(f"{k}={v!r}" for k, v in record.fields.items())
+                    message = f"{message} [dim]{escape(fields)}[/dim]"
+                moment = escape(time.strftime("[%X]", time.localtime(record.time)))
+                self.console.print(
+                    f"[log.time]{moment}[/log.time] {message} "
+                    f"[log.path]{escape(record.origin)}[/log.path]"
+                )
+
+    def close(self) -> None:
+        pass
+
+
+class Logger:
+    """Queues records, which a background thread writes to `sink` in batches
+    of up to `batch_size`."""
+
+    def __init__(
+        self,
+        sink: Any,
+        level: Any = INFO,
+        sampling: Optional[dict[str, float]] = None,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+    ) -> None:
+        self.sink = sink
+        self.level = get_level(level)
+        # Level name or event name -> fraction of records kept
+        self.sampling: dict[str, float] = sampling or {}
+        self.level_sampling: dict[int, float] = {
+            get_level(name): rate
+            for name, rate in self.sampling.items()
+            if name in level_names.values()
+        }
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        # Unbounded, but cheaper to put to than `queue.Queue` (see `log`)
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread = threading.Thread(
+            target=self.write_batches, name="FeynbotLogs", daemon=True
+        )
+        self.thread.start()
+        # Whatever is queued is still written if the bot crashes.
+        atexit.register(self.close)
+        # Metrics
+        self.queued: int = 0
+        self.sampled_out: int = 0
+        self.dropped: int = 0
+        self.written: int = 0
+        self.batches: int = 0
+        self.failures: int = 0
+
+    def log(
+        self,
+        message: Any,
+        level: int = INFO,
+        stack_offset: int = 1,
+        **fields: Any,
+    ) -> None:
+        """Queue a record.  `stack_offset` is how many frames up the origin is,
+        1 being whatever called this."""
+        if level < self.level:
+            return
+        event = current_event.get()
+        rate = self.sampling.get(event) if event else None  # type: ignore
+        if rate is None:
+            rate = self.level_sampling.get(level)
+        if rate is not None and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        try:
+            frame = sys._getframe(stack_offset)
+            file, line = frame.f_code.co_filename, frame.f_lineno
+        except ValueError:
+            file, line = None, None
+        record = LogRecord(time.time(), level, str(message), event, file, line, fields)
+        if self.queue.qsize() >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+        self.queued += 1
+
+    def debug(self, message: Any, stack_offset: int = 2, **fields: Any) -> None:
+        self.log(message, DEBUG, stack_offset, **fields)
+
+    def info(self, message: Any, stack_offset: int = 2, **fields: Any) -> None:
+        self.log(message, INFO, stack_offset, **fields)
+
+    def warning(self, message: Any, stack_offset: int = 2, **fields: Any) -> None:
+        self.log(message, WARNING, stack_offset, **fields)
+
+    def error(self, message: Any, stack_offset: int = 2, **fields: Any) -> None:
+        self.log(message, ERROR, stack_offset, **fields)
+
+    def write_batches(self) -> None:
+        stopping = False
+        while not stopping:
+            # Blocks until there's something to write, then takes the rest.
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+            if not batch:
+                continue
+            try:
+                self.sink.write(batch)
+            except Exception:
+                # Nowhere left to report it.
+                self.failures += 1
+                continue
+            self.written += len(batch)
+            self.batches += 1
+
+    def close(self) -> None:
+        """Write whatever is queued, and stop the thread."""
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "queued": self.queued,
+            "depth": self.queue.qsize(),
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+
+def create_logger(
+    console: Any = None,
+    format: str = "rich",
+    path: Optional[str] = None,
+    **kwargs: Any,
+) -> Logger:
+    """Create a logger from the bot's `logging` options."""
+    if format == "json":
+        return Logger(JSONSink(path), **kwargs)
+    if format == "rich":
+        if console is None:
+            from rich.console import Console
+
+            console = Console()
+        return Logger(RichSink(console), **kwargs)
+    raise ValueError(f"`{format}` is not a valid log format.  Valid: rich, json.")
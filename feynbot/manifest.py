@@ -0,0 +1,172 @@
+"""A persisted manifest of what every event and command file registers, so that
+files can be registered at startup without being imported.  A file whose
+content hash matches its manifest entry is registered with placeholder
+listeners and commands, and only imported when one of them first fires (or
+the handler's warm-up reaches it)."""
+
+import json
+import os
+import pathlib
+from typing import Any, Callable, Optional
+
+from Feynbot.commands import Command, CommandTree
+from Feynbot.events import Event, EventTree
+
+manifest_version = 2
+
+
+class Manifest:
+    """The manifest file, mapping file paths to what they register."""
+
+    def __init__(self, path: str) -> None:
+        self.path = pathlib.Path(path)
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.changed: bool = False
+        self.load()
+
+    def load(self) -> None:
+        if not self.path.is_file():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except ValueError:
+            return
+        if data.get("version") != manifest_version:
+            return
+        self.entries = data.get("files", {})
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        data = {"version": manifest_version, "files": self.entries}
+        # Replaced whole, as clusters (see `cluster.py`) read it concurrently.
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        os.replace(temporary, self.path)
+        self.changed = False
+
+    def get(self, path: pathlib.Path, digest: str) -> Optional[dict[str, Any]]:
+        """Get the entry for a file, if it is still up to date and lazy."""
+        entry = self.entries.get(str(path))
+        if entry is None or entry["digest"] != digest or not entry["lazy"]:
+            return None
+        return entry
+
+    def set(self, path: pathlib.Path, digest: str, entry: dict[str, Any]) -> None:
+        entry = {"digest": digest, **entry}
+        if self.entries.get(str(path)) != entry:
+            self.entries[str(path)] = entry
+            self.changed = True
+
+    def remove(self, path: pathlib.Path) -> None:
+        if self.entries.pop(str(path), None) is not None:
+            self.changed = True
+
+
+# Events
+def flatten_events(tree: EventTree) -> list[Event]:
+    """Get every event in a tree, in tree order (which doesn't change when the
+    tree is parented, unlike the order of the root's index)."""
+    return tree.get_events()
+
+
+def describe_event_trees(trees: tuple[EventTree, ...]) -> dict[str, Any]:
+    described = []
+    lazy = True
+    for tree in trees:
+        events = []
+        for event in flatten_events(tree):
+            # Coalescing keys can't be stored.
+            if event.coalescer is not None:
+                lazy = False
+            events.append(
+                {
+                    "name": event.name,
+                    "event_name": event.event_name,
+                    "enabled": event.enabled,
+                    "persistent": event.persistent,
+                    "terminal": event.terminal,
+                    "priority": event.priority,
+                    "concurrent": event.concurrent,
+                    "always": event.always,
+                    "oids": list(event.oids),
+                }
+            )
+        described.append({"name": tree.name, "events": events})
+    return {"lazy": lazy, "event_trees": described}
+
+
+def build_event_placeholders(
+    entry: dict[str, Any],
+    origin: str,
+    file_path: str,
+    stub: Callable[[int, int], Callable[..., Any]],
+) -> tuple[EventTree, ...]:
+    """Build trees of placeholder events from a manifest entry.  `stub(tree,
+    event)` makes the function bound to the placeholder at those indices."""
+    trees = []
+    for tree_index, described_tree in enumerate(entry["event_trees"]):
+        tree = EventTree(described_tree["name"], origin=origin, file_path=file_path)
+        for event_index, described in enumerate(described_tree["events"]):
+            event = Event(
+                node_name=described["name"],
+                origin=origin,
+                file_path=file_path,
+                parent=tree,
+            )
+            event.enabled = described["enabled"]
+            event.persistent = described["persistent"]
+            event.terminal = described["terminal"]
+            event.priority = described["priority"]
+            event.concurrent = described["concurrent"]
+            event.always = described["always"]
+            event.set_oids(*described["oids"])
+            event.bind(described["event_name"])(stub(tree_index, event_index))
+        trees.append(tree)
+    return tuple(trees)
+
+
+# Commands
+def describe_command_trees(trees: tuple[CommandTree, ...]) -> dict[str, Any]:
+    described = []
+    for tree in trees:
+        commands = []
+        for command in tree:
+            commands.append(
+                {
+                    "name": command.name,
+                    "command_name": command.command_name,
+                    "description": command.description,
+                    "enabled": command.enabled,
+                    "gids": list(command.gids),
+                }
+            )
+        described.append({"name": tree.name, "commands": commands})
+    return {"lazy": True, "command_trees": described}
+
+
+def build_command_placeholders(
+    entry: dict[str, Any],
+    origin: str,
+    file_path: str,
+    stub: Callable[[int, int], Callable[..., Any]],
+) -> tuple[CommandTree, ...]:
+    trees = []
+    for tree_index, described_tree in enumerate(entry["command_trees"]):
+        tree = CommandTree(described_tree["name"], origin=origin, file_path=file_path)
+        for command_index, described in enumerate(described_tree["commands"]):
+            command = Command(
+                command_name=described["command_name"],
+                node_name=described["name"],
+                enabled=described["enabled"],
+                gids=described["gids"] or None,
+                description=described["description"],
+                origin=origin,
+                file_path=file_path,
+                parent=tree,
+            )
+            command.bind(
+                described["command_name"], description=described["description"]
+            )(stub(tree_index, command_index))
+        trees.append(tree)
+    return tuple(trees)
@@ -0,0 +1,222 @@
+"""Member chunking on Feynbot's terms, rather than `discord.py`'s.  With the
+members intent, `discord.py` requests every guild's full member list before
+`on_ready`, which for large guilds takes minutes and keeps every member
+cached, whether or not any listener needs them.
+
+Here, guilds aren't chunked at startup.  A guild is chunked on demand, the
+first time a listener or command asks for its members through the context
+(`context.get_members`), or by background workers after `on_ready`, smallest
+guilds first.  At most `max_concurrency` guilds are chunked at a time, by as
+many workers, each waiting `interval` seconds between guilds, and on-demand
+requests go ahead of them (including for a guild already waiting to be
+chunked in the background).  Guilds with more than `max_members` are only
+chunked on demand.  Chunked members are trimmed of cosmetic fields (see
+`trimmed`)."""
+
+import asyncio
+import itertools
+import time
+from heapq import heappop, heappush
+from typing import Any, Optional
+
+import discord
+
+from Feynbot.events import EventTree
+from Feynbot.outbound import PriorityLimiter
+
+# Priorities, lowest first
+ON_DEMAND = 0
+BACKGROUND = 1
+
+# Member and user fields that are only ever displayed, dropped from chunked
+# members with `trim`.  NOTE: A user's avatar decoration isn't dropped, as
+# `discord.py` compares it to tell whether to dispatch `on_user_update`.
+trimmed = ("_avatar_decoration_data", "_banner")
+trimmed_user = ("_banner", "_accent_colour", "_collectibles")
+
+
+def get_cache_flags(
+    intents: discord.Intents, cache: Optional[dict[str, bool]] = None
+) -> discord.MemberCacheFlags:
+    """`discord.py`'s member cache flags, from the `cache` option (e.g.
+    `{"voice": False}`), defaulting to what the intents allow."""
+    flags = discord.MemberCacheFlags.from_intents(intents)
+    for name, value in (cache or {}).items():
+        if name not in discord.MemberCacheFlags.VALID_FLAGS:
+            raise ValueError(
+                f"`{name}` is not a valid member cache flag.  Valid flags: "
+                f"{', '.join(discord.MemberCacheFlags.VALID_FLAGS)}."
+            )
+        setattr(flags, name, value)
+    return flags
+
+
+class MemberChunker:
+    """Chunks guilds on demand, and in the background, each worker
+    `interval` seconds apart."""
+
+    def __init__(
+        self,
+        bot: Any,
+        background: bool = True,
+        max_concurrency: int = 1,
+        interval: float = 1.0,
+        max_members: Optional[int] = None,
+        timeout: float = 60.0,
+        trim: bool = True,
+    ) -> None:
+        self.bot = bot
+        self.background = background
+        self.limiter = PriorityLimiter(max_concurrency)
+        self.interval = interval
+        self.max_members = max_members
+        self.timeout = timeout
+        self.trim = trim
+        # Guild ID -> chunk in progress, shared by everything waiting on it
+        self.chunking: dict[int, asyncio.Task] = {}
+        # Guilds waiting for the background worker, as (members, order, guild)
+        self.queue: list[tuple[int, int, discord.Guild]] = []
+        self.queued: set[int] = set()
+        self.counter = itertools.count()
+        self.workers: set[asyncio.Task] = set()
+        # Metrics
+        self.on_demand: int = 0
+        self.promoted: int = 0
+        self.background_chunks: int = 0
+        self.members_chunked: int = 0
+        self.timeouts: int = 0
+        self.failures: int = 0
+        self.chunk_time: float = 0.0
+
+        # Scheduled after other listeners, as they don't need to wait for it
+        self.tree = EventTree("MemberChunker", persistent=True, priority=-100)
+        bind = self.tree.bind
+        bind("on_ready", "ScheduleChunks", priority=-100)(self.schedule_all)
+        bind("on_guild_join", "ScheduleChunk", priority=-100)(self.schedule)
+        bind("on_guild_remove", "ForgetChunk", priority=-100)(self.forget)
+        if trim:
+            bind("on_member_join", "TrimMember", priority=-100)(self.trim_member)
+
+    @property
+    def enabled(self) -> bool:
+        return self.bot.intents.members
+
+    def is_chunked(self, guild: discord.Guild) -> bool:
+        return guild.chunked or not self.enabled
+
+    async def chunk(
+        self, guild: discord.Guild, priority: int = ON_DEMAND
+    ) -> list[discord.Member]:
+        """Get every member of a guild, chunking it first if it hasn't been
+        (or joining a chunk already in progress)."""
+        if self.is_chunked(guild):
+            return guild.members
+        task = self.chunking.get(guild.id)
+        if task is None:
+            if priority == ON_DEMAND:
+                self.on_demand += 1
+            task = asyncio.get_running_loop().create_task(self.request(guild, priority))
+            self.chunking[guild.id] = task
+            task.add_done_callback(lambda _: self.chunking.pop(guild.id, None))
+        # Still waiting for a slot at a lower priority:
+        elif self.limiter.promote(guild.id, priority):
+            self.promoted += 1
+        # Shielded, so one waiter being cancelled doesn't cancel it for all.
+        return await asyncio.shield(task)
+
+    async def request(
+        self, guild: discord.Guild, priority: int
+    ) -> list[discord.Member]:
+        await self.limiter.acquire(priority, guild.id)
+        try:
+            # Chunked while waiting for a slot
+            if guild.chunked:
+                return guild.members
+            start = time.perf_counter()
+            try:
+                members = await asyncio.wait_for(
+                    guild.chunk(cache=True), timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            except Exception:
+                self.failures += 1
+                raise
+            self.chunk_time += time.perf_counter() - start
+        finally:
+            self.limiter.release()
+        self.members_chunked += len(members)
+        if self.trim:
+            for member in members:
+                self.trim_member(member)
+        return members
+
+    def trim_member(self, member: discord.Member) -> None:
+        # Not every `discord.py` version has every field.
+        for field in trimmed:
+            if hasattr(member, field):
+                setattr(member, field, None)
+        user = member._user
+        for field in trimmed_user:
+            if hasattr(user, field):
+                setattr(user, field, None)
+
+    def schedule_all(self) -> None:
+        for guild in self.bot.guilds:
+            self.schedule(guild)
+
+    def schedule(self, guild: discord.Guild) -> None:
+        """Queue a guild to be chunked in the background."""
+        if not self.background or self.is_chunked(guild) or guild.id in self.queued:
+            return
+        members = guild.member_count or 0
+        if self.max_members is not None and members > self.max_members:
+            return
+        heappush(self.queue, (members, next(self.counter), guild))
+        self.queued.add(guild.id)
+        if len(self.workers) < self.limiter.limit:
+            worker = asyncio.get_running_loop().create_task(self.work())
+            self.workers.add(worker)
+            worker.add_done_callback(self.workers.discard)
+
+    def forget(self, guild: discord.Guild) -> None:
+        self.queued.discard(guild.id)
+
+    async def work(self) -> None:
+        while self.queue:
+            _, _, guild = heappop(self.queue)
+            if guild.id not in self.queued:
+                continue
+            self.queued.discard(guild.id)
+            if self.is_chunked(guild):
+                continue
+            try:
+                await self.chunk(guild, BACKGROUND)
+                self.background_chunks += 1
+            except Exception as exception:
+                self.bot.warning(f"Failed to chunk guild {guild.id}: {exception!r}")
+            await asyncio.sleep(self.interval)
+
+    def metrics(self) -> dict[str, Any]:
+        guilds = self.bot.guilds
+        return {
+            "guilds": len(guilds),
+            "chunked": sum(1 for guild in guilds if guild.chunked),
+            "queued": len(self.queued),
+            "chunking": len(self.chunking),
+            "on_demand": self.on_demand,
+            "promoted": self.promoted,
+            "workers": len(self.workers),
+            "background": self.background_chunks,
+            "members_chunked": self.members_chunked,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "chunk_time": self.chunk_time,
+        }
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        for task in self.chunking.values():
+            task.cancel()
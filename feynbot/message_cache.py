@@ -0,0 +1,208 @@
+"""A compact cache of recent messages, so that edits and deletes of messages
+older than `discord.py`'s small cache of full `Message` objects can still be
+handled.  Only a slotted projection of each message is kept, with its content
+truncated, and the cache is bounded both per channel and by an (estimated)
+memory budget, evicting the oldest messages first.
+
+It is filled from `on_message`, and kept up to date from the raw edit and
+delete events, which fire whether or not `discord.py` had the message cached.
+All of them go through the scheduler's `messages` queue, in the order they
+were received, so a message is cached before its edits and deletes apply.
+Listeners read it through `context.cached_message` (or `get`), before the
+cache applies the edit or delete, as it does so at the lowest priority (and
+`always`, so even if a listener before it raised)."""
+
+import sys
+import zlib
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+import discord
+
+from Feynbot.events import EventTree
+
+# Estimated bytes per cached message besides its content: the record itself,
+# and its entries in the channel's and the global dicts (about 190 bytes on
+# CPython 3.11).
+entry_overhead = 200
+
+
+class CachedMessage:
+    __slots__ = (
+        "id",
+        "channel_id",
+        "guild_id",
+        "author_id",
+        "content",
+        "content_hash",
+        "edited_at",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        channel_id: int,
+        guild_id: Optional[int],
+        author_id: int,
+        content: str,
+        content_hash: int,
+        edited_at: Optional[float] = None,
+    ) -> None:
+        self.id = id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        # Truncated to the cache's `max_content`
+        self.content = content
+        # Of the whole content, to tell whether an edit changed it
+        self.content_hash = content_hash
+        self.edited_at = edited_at
+
+    @property
+    def created_at(self) -> float:
+        return discord.utils.snowflake_time(self.id).timestamp()
+
+    def __repr__(self) -> str:
+        return (
+            f"<CachedMessage id={self.id} channel_id={self.channel_id} "
+            f"author_id={self.author_id} content={self.content!r}>"
+        )
+
+
+class MessageCache:
+    """Recent messages, at most `max_per_channel` per channel, and about
+    `max_bytes` in all."""
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_per_channel: int = 1000,
+        max_content: int = 200,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_per_channel = max_per_channel
+        self.max_content = max_content
+        # Channel ID -> message ID -> message, oldest first
+        self.channels: dict[int, OrderedDict[int, CachedMessage]] = {}
+        # Message ID -> channel ID, oldest first
+        self.order: OrderedDict[int, int] = OrderedDict()
+        self.bytes: int = 0
+        # Metrics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        # Filled before other listeners, and updated after them
+        self.tree = EventTree("MessageCache", persistent=True, priority=100)
+        bind = self.tree.bind
+        bind("on_message", "CacheMessage", priority=100)(self.add)
+        bind("on_raw_message_edit", "CacheEdit", priority=-100, always=True)(
+            self.on_edit
+        )
+        bind("on_raw_message_delete", "CacheDelete", priority=-100, always=True)(
+            self.on_delete
+        )
+        bind(
+            "on_raw_bulk_message_delete", "CacheBulkDelete", priority=-100, always=True
+        )(self.on_bulk_delete)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self.order
+
+    @staticmethod
+    def get_size(message: CachedMessage) -> int:
+        return entry_overhead + sys.getsizeof(message.content)
+
+    def add(self, message: discord.Message) -> None:
+        content = message.content or ""
+        cached = CachedMessage(
+            message.id,
+            message.channel.id,
+            message.guild.id if message.guild else None,
+            message.author.id,
+            content[: self.max_content],
+            zlib.crc32(content.encode("utf-8")),
+        )
+        self.remove(cached.id)
+        channel = self.channels.get(cached.channel_id)
+        if channel is None:
+            channel = self.channels[cached.channel_id] = OrderedDict()
+        channel[cached.id] = cached
+        self.order[cached.id] = cached.channel_id
+        self.bytes += self.get_size(cached)
+        if len(channel) > self.max_per_channel:
+            self.remove(next(iter(channel)))
+            self.evictions += 1
+        while self.bytes > self.max_bytes and self.order:
+            self.remove(next(iter(self.order)))
+            self.evictions += 1
+
+    def remove(self, message_id: int) -> Optional[CachedMessage]:
+        channel_id = self.order.pop(message_id, None)
+        if channel_id is None:
+            return None
+        channel = self.channels[channel_id]
+        cached = channel.pop(message_id)
+        if not channel:
+            del self.channels[channel_id]
+        self.bytes -= self.get_size(cached)
+        return cached
+
+    def get(self, message_id: int) -> Optional[CachedMessage]:
+        channel_id = self.order.get(message_id)
+        if channel_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.channels[channel_id][message_id]
+
+    def get_many(self, message_ids: Iterable[int]) -> list[CachedMessage]:
+        """Get whichever of the messages are cached, oldest first."""
+        messages = [self.get(message_id) for message_id in sorted(message_ids)]
+        return [message for message in messages if message is not None]
+
+    def get_channel(self, channel_id: int) -> list[CachedMessage]:
+        """Get a channel's cached messages, oldest first."""
+        return list(self.channels.get(channel_id, {}).values())
+
+    def on_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        cached = self.channels.get(payload.channel_id, {}).get(payload.message_id)
+        # Embeds resolving also fire edits, without any content.
+        content = payload.data.get("content")
+        if cached is None or content is None:
+            return
+        self.bytes -= self.get_size(cached)
+        cached.content = content[: self.max_content]
+        cached.content_hash = zlib.crc32(content.encode("utf-8"))
+        edited_at = payload.data.get("edited_timestamp")
+        if edited_at:
+            cached.edited_at = discord.utils.parse_time(edited_at).timestamp()
+        self.bytes += self.get_size(cached)
+
+    def on_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        self.remove(payload.message_id)
+
+    def on_bulk_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        for message_id in payload.message_ids:
+            self.remove(message_id)
+
+    def clear(self) -> None:
+        self.channels.clear()
+        self.order.clear()
+        self.bytes = 0
+
+    def metrics(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "messages": len(self.order),
+            "channels": len(self.channels),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
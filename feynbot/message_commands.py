@@ -0,0 +1,217 @@
+"""Text commands, run from messages starting with the bot's prefix, for when
+slash commands are too slow to use.  Any command in the command trees can be
+run this way.  As slash command groups aren't supported yet, hyphenated command
+names are run as subcommands too (`config-set` as `config set`).
+
+Most messages aren't commands, so rejecting them is kept as cheap as possible:
+the router listens to `on_message` synchronously, skips bots, reads the
+guild's prefix from the settings cache without awaiting, and checks the
+message starts with it.  Only then is a task started to find the command, in
+a trie of command names, and run it.  If the guild's settings aren't cached,
+they're loaded once in the background, and meanwhile only messages starting
+with the default prefix wait for them (a custom prefix is missed until then).
+Guild overrides are resolved as for slash commands (`CommandTree.resolve`).
+Arguments are split on whitespace in one pass, with double quotes grouping
+words, and are passed as `context.arguments`."""
+
+import asyncio
+from typing import Any, Optional
+
+import discord
+
+from Feynbot.context import Context
+from Feynbot.events import EventTree
+from Feynbot.logs import current_event
+
+
+class TrieNode:
+    __slots__ = ("children", "name")
+
+    def __init__(self) -> None:
+        # Word -> node of the words after it
+        self.children: dict[str, TrieNode] = {}
+        # The command name ending here, if any
+        self.name: Optional[str] = None
+
+
+def split_arguments(text: str) -> list[str]:
+    """Split text on whitespace, keeping double-quoted text together.  An
+    unclosed quote runs to the end."""
+    arguments: list[str] = []
+    current: list[str] = []
+    quoted = False
+    started = False
+    for character in text:
+        if character == '"':
+            quoted = not quoted
+            started = True
+        elif quoted or not character.isspace():
+            current.append(character)
+            started = True
+        elif started:
+            arguments.append("".join(current))
+            current = []
+            started = False
+    if started:
+        arguments.append("".join(current))
+    return arguments
+
+
+class MessageRouter:
+    """Routes prefixed messages to commands.  A guild's prefix is its
+    `setting` in the settings cache, or `prefix`."""
+
+    def __init__(
+        self,
+        handler: Any,
+        prefix: str = ">",
+        setting: str = "prefix",
+        ignore_bots: bool = True,
+    ) -> None:
+        if not prefix:
+            raise ValueError("The message command prefix can't be empty.")
+        self.handler = handler
+        self.prefix = prefix
+        self.setting = setting
+        self.ignore_bots = ignore_bots
+        # Built when first needed, and again after commands change
+        self.trie: Optional[TrieNode] = None
+        self.depth: int = 0
+        self.tasks: set[asyncio.Task] = set()
+        # Guilds whose settings are being loaded
+        self.loading: set[Optional[int]] = set()
+        # Metrics
+        self.messages: int = 0
+        self.prefixed: int = 0
+        self.fired: int = 0
+        self.unknown: int = 0
+
+        # Before other listeners, as it only starts a task for commands
+        self.tree = EventTree("MessageCommands", persistent=True, priority=100)
+        bind = self.tree.bind
+        bind("on_message", "RouteMessageCommand", priority=100)(self.route)
+
+    def build(self) -> TrieNode:
+        """Build the trie of command names, by words."""
+        root = TrieNode()
+        depth = 0
+        for name, _ in self.handler.command_trees.get_resolutions():
+            for words in {(name,), tuple(name.split("-"))}:
+                node = root
+                for word in words:
+                    child = node.children.get(word)
+                    if child is None:
+                        child = node.children[word] = TrieNode()
+                    node = child
+                node.name = name
+                depth = max(depth, len(words))
+        self.trie = root
+        self.depth = depth
+        return root
+
+    def invalidate(self) -> None:
+        self.trie = None
+
+    def route(self, message: discord.Message) -> None:
+        self.messages += 1
+        content = message.content
+        if not content or self.ignores(message):
+            return
+        guild = message.guild
+        gid = guild.id if guild else None
+        settings = self.handler.settings.peek(gid)
+        if settings is None:
+            if gid not in self.loading:
+                self.loading.add(gid)
+                self.spawn(self.load(gid))
+            # The guild's prefix is checked once they're loaded.
+            if content.startswith(self.prefix):
+                self.spawn(self.route_loaded(message, gid))
+            return
+        prefix = settings.get(self.setting) or self.prefix
+        if not content.startswith(prefix):
+            return
+        self.prefixed += 1
+        self.spawn(self.run(message, gid, content[len(prefix) :]))
+
+    async def route_loaded(self, message: discord.Message, gid: Optional[int]) -> None:
+        settings = await self.handler.settings.get(gid)
+        prefix = settings.get(self.setting) or self.prefix
+        if message.content.startswith(prefix):
+            self.prefixed += 1
+            await self.run(message, gid, message.content[len(prefix) :])
+
+    async def load(self, gid: Optional[int]) -> None:
+        try:
+            await self.handler.settings.get(gid)
+        finally:
+            self.loading.discard(gid)
+
+    def ignores(self, message: discord.Message) -> bool:
+        return self.ignore_bots and message.author.bot
+
+    def find(self, text: str) -> list[tuple[str, int]]:
+        """Find the command names `text` starts with, as (name, words), the
+        longest first."""
+        trie = self.trie or self.build()
+        matches = []
+        node = trie
+        for index, word in enumerate(text.split(None, self.depth)[: self.depth]):
+            node = node.children.get(word.lower())  # type: ignore
+            if node is None:
+                break
+            if node.name is not None:
+                matches.append((node.name, index + 1))
+        matches.reverse()
+        return matches
+
+    async def run(self, message: discord.Message, gid: Optional[int], text: str):
+        for name, words in self.find(text):
+            try:
+                command = self.handler.command_trees.resolve(name, gid)
+            except IndexError:
+                # Only an override in other guilds; a shorter name may match.
+                continue
+            parts = text.split(None, words)
+            arguments = split_arguments(parts[words]) if len(parts) > words else []
+            context = Context(
+                self.handler.bot,
+                name,
+                (message,),
+                {"arguments": arguments},
+                self.handler.db,
+            )
+            self.fired += 1
+            token = current_event.set(name)
+            try:
+                await command.fire(context)
+            finally:
+                current_event.reset(token)
+            return
+        self.unknown += 1
+
+    def spawn(self, coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(self.guard(coroutine))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def guard(self, coroutine) -> None:
+        # Started outside the event's dispatch, so errors are reported here.
+        try:
+            await coroutine
+        except Exception:
+            await self.handler.handle_error("on_message_command")
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "messages": self.messages,
+            "prefixed": self.prefixed,
+            "fired": self.fired,
+            "unknown": self.unknown,
+            "running": len(self.tasks),
+            "loading": len(self.loading),
+        }
+
+    def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
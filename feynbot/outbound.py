@@ -0,0 +1,266 @@
+"""Outbound messages, scheduled around Discord's rate limits rather than sent
+straight through `discord.py` from every listener.
+
+Messages are queued per channel (a channel being its own rate limit bucket for
+messages), and each channel sends one message at a time, highest priority
+first.  Plain texts still pending for a channel are merged into one message,
+up to Discord's length limit, unless sent with `coalesce=False`.  Sends across
+all channels are capped at `max_concurrency`, and waiting sends are let
+through by priority, so urgent messages go ahead of bulk notifications.
+
+Interaction responses, which expire after 3 seconds, skip the queues and the
+limiter entirely: they're sent to the interaction's webhook, its own rate limit
+bucket, so they never wait behind channel sends."""
+
+import asyncio
+import itertools
+import logging
+from heapq import heappop, heappush
+from typing import Any, Hashable, Optional
+
+import discord
+
+# Priorities, lowest first
+HIGH = 0
+NORMAL = 1
+BULK = 2
+
+# Discord's limit on a message's content
+max_length = 2000
+
+
+class PriorityLimiter:
+    """A semaphore that lets waiters through by priority, then in order.
+    Waiters acquiring with a `key` can be promoted while they wait."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.active: int = 0
+        self.waiters: list[tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        # Key -> (priority, future) of a waiter
+        self.keys: dict[Hashable, tuple[int, asyncio.Future]] = {}
+
+    async def acquire(self, priority: int, key: Optional[Hashable] = None) -> None:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heappush(self.waiters, (priority, next(self.counter), future))
+        if key is not None:
+            self.keys[key] = (priority, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Handed a slot just before being cancelled:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if key is not None:
+                self.keys.pop(key, None)
+
+    def promote(self, key: Hashable, priority: int) -> bool:
+        """Move a waiter up to `priority`, if it's waiting with a lower one.
+        Its old entry is left in the heap, and skipped once it's let through."""
+        waiter = self.keys.get(key)
+        if waiter is None or waiter[0] <= priority:
+            return False
+        future = waiter[1]
+        heappush(self.waiters, (priority, next(self.counter), future))
+        self.keys[key] = (priority, future)
+        return True
+
+    def release(self) -> None:
+        # The slot is handed over, rather than freed and raced for.
+        while self.waiters:
+            _, _, future = heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class OutboundMessage:
+    __slots__ = ("destination", "content", "kwargs", "mergeable", "future")
+
+    def __init__(
+        self,
+        destination: discord.abc.Messageable,
+        content: Optional[str],
+        kwargs: dict[str, Any],
+        mergeable: bool,
+        future: asyncio.Future,
+    ) -> None:
+        self.destination = destination
+        self.content = content
+        self.kwargs = kwargs
+        self.mergeable = mergeable
+        self.future = future
+
+
+class RateLimitCounter(logging.Handler):
+    """Counts the rate limits `discord.py` hits and waits out itself, which it
+    only logs."""
+
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.count: int = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Per-route ("We are being rate limited") and global rate limits
+        message = str(record.msg).lower()
+        if "rate limited" in message or "rate limit has been hit" in message:
+            self.count += 1
+
+
+class Outbox:
+    """Queues of outbound messages, per channel."""
+
+    def __init__(self, max_concurrency: int = 8, max_pending: int = 100) -> None:
+        self.limiter = PriorityLimiter(max_concurrency)
+        self.max_pending = max_pending
+        # Channel ID -> pending messages, as (priority, order, message)
+        self.channels: dict[int, list[tuple[int, int, OutboundMessage]]] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.counter = itertools.count()
+        self.rate_limits = RateLimitCounter()
+        logging.getLogger("discord.http").addHandler(self.rate_limits)
+        # Metrics
+        self.queued: int = 0
+        self.sent: int = 0
+        self.responses: int = 0
+        self.merged: int = 0
+        self.dropped: int = 0
+        self.failed: int = 0
+        self.rejected_429: int = 0
+        self.peak_depth: int = 0
+
+    def send(
+        self,
+        destination: discord.abc.Messageable,
+        content: Optional[str] = None,
+        priority: int = NORMAL,
+        coalesce: bool = True,
+        **kwargs: Any,
+    ) -> asyncio.Future:
+        """Queue a message, returning a future of the sent message (shared by
+        every text merged into it).  Doesn't need to be awaited."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(self.count_failure)
+        key = destination.id  # type: ignore
+        pending = self.channels.get(key)
+        if pending is None:
+            pending = self.channels[key] = []
+        if len(pending) >= self.max_pending:
+            self.dropped += 1
+            future.set_exception(
+                ValueError(
+                    f"Too many messages pending for channel {key}, the limit "
+                    f"being {self.max_pending}."
+                )
+            )
+            return future
+        # Only plain texts are merged.
+        mergeable = coalesce and not kwargs and bool(content)
+        message = OutboundMessage(destination, content, kwargs, mergeable, future)
+        heappush(pending, (priority, next(self.counter), message))
+        self.queued += 1
+        self.peak_depth = max(self.peak_depth, self.depth)
+        if key not in self.workers:
+            self.workers[key] = loop.create_task(self.drain(key))
+        return future
+
+    async def respond(
+        self, interaction: discord.Interaction, content: Optional[str] = None, **kwargs
+    ) -> Any:
+        """Respond to an interaction (or follow up, if already responded to),
+        straight away rather than through the limiter."""
+        try:
+            if interaction.response.is_done():
+                sent = await interaction.followup.send(content, **kwargs)
+            else:
+                sent = await interaction.response.send_message(content, **kwargs)
+        except discord.HTTPException as exception:
+            if exception.status == 429:
+                self.rejected_429 += 1
+            raise
+        self.responses += 1
+        return sent
+
+    async def drain(self, key: int) -> None:
+        pending = self.channels[key]
+        try:
+            while pending:
+                priority, _, message = heappop(pending)
+                messages = [message]
+                content = message.content
+                # Merge the texts queued right behind, at the same priority.
+                while message.mergeable and pending:
+                    next_priority, _, next_message = pending[0]
+                    if next_priority != priority or not next_message.mergeable:
+                        break
+                    merged = f"{content}\n{next_message.content}"
+                    if len(merged) > max_length:
+                        break
+                    heappop(pending)
+                    messages.append(next_message)
+                    content = merged
+                await self.deliver(priority, messages, content)
+        finally:
+            del self.channels[key]
+            del self.workers[key]
+
+    async def deliver(
+        self, priority: int, messages: list[OutboundMessage], content: Optional[str]
+    ) -> None:
+        first = messages[0]
+        await self.limiter.acquire(priority)
+        try:
+            sent = await first.destination.send(content, **first.kwargs)
+        except Exception as exception:
+            if isinstance(exception, discord.HTTPException) and exception.status == 429:
+                self.rejected_429 += 1
+            for message in messages:
+                if not message.future.done():
+                    message.future.set_exception(exception)
+            return
+        finally:
+            self.limiter.release()
+        self.sent += 1
+        self.merged += len(messages) - 1
+        for message in messages:
+            if not message.future.done():
+                message.future.set_result(sent)
+
+    def count_failure(self, future: asyncio.Future) -> None:
+        # Also marks the exception as retrieved, for messages nobody awaits.
+        if not future.cancelled() and future.exception() is not None:
+            self.failed += 1
+
+    @property
+    def depth(self) -> int:
+        return sum(len(pending) for pending in self.channels.values())
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "channels": len(self.channels),
+            "in_flight": self.limiter.active,
+            "waiting": len(self.limiter.waiters),
+            "queued": self.queued,
+            "sent": self.sent,
+            "responses": self.responses,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "rate_limited": self.rate_limits.count,
+            "rejected_429": self.rejected_429,
+        }
+
+    def close(self) -> None:
+        for worker in self.workers.values():
+            worker.cancel()
+        logging.getLogger("discord.http").removeHandler(self.rate_limits)
@@ -0,0 +1,418 @@
+"""Recording of dispatched events, and offline replay of recordings, to profile
+listener changes against real traffic before shipping them.
+
+Events are recorded where `Handler.hook_events` receives them, as JSON lines in
+a gzip file, written on the recorder's own thread rather than the event loop.
+Every flush appends its own complete gzip member, so a file can be recorded to
+across restarts, is still read as one, and is readable up to the last flush
+even if the bot dies (a member cut off mid-write is skipped).  Discord objects
+are reduced to what `Context` resolves (IDs, names, message content), and are
+rebuilt as `Replay*` objects when replayed, sharing one object per ID like the
+client's cache does.
+
+With `anonymise`, user IDs are replaced by keyed hashes (consistent within a
+recording, across sessions, with the key kept next to it in a `.key` file not
+to be shared), names are dropped and every word character of message content
+is masked, keeping its length and punctuation (so prefixes still match).
+Guild and channel IDs are kept, as scoped listeners are routed by them."""
+
+import asyncio
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Iterator, Optional
+
+import discord
+
+version = 1
+word_pattern = re.compile(r"\w")
+
+
+# Rebuilt objects, passing the `isinstance` checks `Context` resolves with
+class ReplayGuild(discord.Guild):
+    __slots__ = ()
+
+    def __init__(self, id: int, name: Optional[str] = None) -> None:
+        self.id = id
+        self.name = name or f"Guild {id}"
+        self._roles: dict[int, discord.Role] = {}
+
+
+class ReplayChannel(discord.TextChannel):
+    __slots__ = ()
+
+    def __init__(
+        self, id: int, guild: Optional[ReplayGuild], name: Optional[str] = None
+    ) -> None:
+        self.id = id
+        self.guild = guild  # type: ignore
+        self.name = name or f"channel-{id}"
+
+
+class ReplayUser(discord.User):
+    __slots__ = ()
+
+    def __init__(self, id: int, name: Optional[str] = None, bot: bool = False) -> None:
+        self.id = id
+        self.name = name or f"user{id}"
+        self.discriminator = "0"
+        self.bot = bot
+        self.system = False
+        # `discord.abc.User` is checked at runtime by reading its attributes.
+        for slot in discord.user.BaseUser.__slots__:
+            if not hasattr(self, slot):
+                setattr(self, slot, None)
+
+
+class ReplayMember(discord.Member):
+    __slots__ = ()
+
+    def __init__(self, user: ReplayUser, guild: ReplayGuild) -> None:
+        self._user = user
+        self.guild = guild
+        self.nick = None
+        self._roles = discord.utils.SnowflakeList([])
+        # Everything else a member has is empty.
+        for slot in discord.Member.__slots__:
+            if not hasattr(self, slot):
+                setattr(self, slot, None)
+
+
+class ReplayMessage(discord.Message):
+    __slots__ = ()
+
+    def __init__(
+        self,
+        id: int,
+        channel: ReplayChannel,
+        author: Optional[discord.abc.User],
+        content: str = "",
+    ) -> None:
+        self.id = id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author  # type: ignore
+        self.content = content
+
+
+class Anonymiser:
+    """Replaces user IDs with keyed hashes, and masks names and content."""
+
+    def __init__(self, key: Optional[bytes] = None) -> None:
+        # Random per recording, unless given, so hashes can't be reversed by
+        # hashing known IDs.
+        self.key = key or os.urandom(16)
+        self.ids: dict[int, int] = {}
+
+    def user_id(self, id: int) -> int:
+        hashed = self.ids.get(id)
+        if hashed is None:
+            digest = hashlib.blake2b(
+                id.to_bytes(8, "little"), key=self.key, digest_size=8
+            ).digest()
+            # Snowflake-sized, so it's still a valid ID.
+            hashed = int.from_bytes(digest, "little") >> 1
+            self.ids[id] = hashed
+        return hashed
+
+    @staticmethod
+    def content(content: str) -> str:
+        return word_pattern.sub("x", content)
+
+
+def get_key(path: str) -> bytes:
+    """Get a recording's anonymisation key, creating it if it has none, so that
+    every session of a recording hashes IDs the same way."""
+    key_path = f"{path}.key"
+    try:
+        with open(key_path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        pass
+    key = os.urandom(16)
+    # Only readable by the bot, as the key reverses hashes of known IDs.
+    descriptor = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(key)
+    return key
+
+
+class Recorder:
+    """Appends dispatched events to a gzip file of JSON lines.  Records are
+    buffered, and written every `max_size` records or `interval` seconds, in
+    order, by a single background thread."""
+
+    def __init__(
+        self,
+        path: str,
+        anonymise: bool = False,
+        max_size: int = 256,
+        interval: float = 5.0,
+    ) -> None:
+        self.path = path
+        self.anonymiser: Optional[Anonymiser] = None
+        if anonymise:
+            self.anonymiser = Anonymiser(get_key(path))
+        self.max_size = max_size
+        self.interval = interval
+        self.start = time.monotonic()
+        self.pending: list[str] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="FeynbotRecording")
+        self.closed = False
+        header = {
+            "version": version,
+            "started": time.time(),
+            "anonymised": anonymise,
+        }
+        self.pending.append(json.dumps(header))
+        # Metrics
+        self.recorded: int = 0
+        self.unencodable: int = 0
+        self.flushes: int = 0
+        self.failures: int = 0
+
+    def record(self, event_name: str, args: tuple[Any, ...], kwargs: dict) -> None:
+        offset = round(time.monotonic() - self.start, 4)
+        entry: list[Any] = [offset, event_name, [self.encode(arg) for arg in args]]
+        if kwargs:
+            entry.append({key: self.encode(value) for key, value in kwargs.items()})
+        self.pending.append(json.dumps(entry, separators=(",", ":")))
+        self.recorded += 1
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            loop = asyncio.get_running_loop()
+            self.timer = loop.call_later(self.interval, self.flush)
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending or self.closed:
+            return
+        pending, self.pending = self.pending, []
+        self.writer.submit(self.write, pending)
+
+    def write(self, pending: list[str]) -> None:
+        # A complete member, so the file is readable up to here, even if the
+        # bot dies before closing it.
+        try:
+            with gzip.open(self.path, "ab") as file:
+                file.write(("\n".join(pending) + "\n").encode("utf-8"))
+        except Exception:
+            # Nowhere to report it from the writer's thread.
+            self.failures += 1
+            return
+        self.flushes += 1
+
+    def close(self) -> None:
+        """Write whatever is pending, waiting for every write to finish."""
+        self.flush()
+        self.closed = True
+        self.writer.shutdown(wait=True)
+
+    def encode(self, value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, discord.Message):
+            return {
+                "~": "message",
+                "id": value.id,
+                "channel": self.encode(value.channel),
+                "author": self.encode(value.author),
+                "content": self.encode_content(value.content),
+            }
+        if isinstance(value, discord.Guild):
+            return {"~": "guild", "id": value.id, "name": self.encode_name(value.name)}
+        if isinstance(value, (discord.Member, discord.User, discord.ClientUser)):
+            encoded = {
+                "~": "user",
+                "id": self.encode_user_id(value.id),
+                "name": self.encode_name(value.name),
+                "bot": value.bot,
+            }
+            guild = getattr(value, "guild", None)
+            if guild is not None:
+                encoded["guild"] = guild.id
+            return encoded
+        if isinstance(value, (discord.abc.GuildChannel, discord.Thread)):
+            return {
+                "~": "channel",
+                "id": value.id,
+                "guild": value.guild.id,
+                "name": self.encode_name(value.name),
+            }
+        if isinstance(value, discord.abc.PrivateChannel):
+            return {"~": "channel", "id": value.id, "guild": None, "name": None}
+        if isinstance(value, datetime.datetime):
+            return {"~": "datetime", "value": value.isoformat()}
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        # Replayed as `None`, but still recorded, so the arguments line up.
+        self.unencodable += 1
+        return {"~": type(value).__name__}
+
+    def encode_user_id(self, id: int) -> int:
+        return self.anonymiser.user_id(id) if self.anonymiser else id
+
+    def encode_name(self, name: Optional[str]) -> Optional[str]:
+        return None if self.anonymiser else name
+
+    def encode_content(self, content: str) -> str:
+        return self.anonymiser.content(content) if self.anonymiser else content
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "recorded": self.recorded,
+            "unencodable": self.unencodable,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
+
+
+class Decoder:
+    """Rebuilds recorded arguments, keeping one object per ID."""
+
+    def __init__(self) -> None:
+        self.guilds: dict[int, ReplayGuild] = {}
+        self.channels: dict[int, ReplayChannel] = {}
+        self.users: dict[int, ReplayUser] = {}
+        self.members: dict[tuple[int, int], ReplayMember] = {}
+
+    def get_guild(self, id: Optional[int], name: Optional[str] = None) -> Any:
+        if id is None:
+            return None
+        guild = self.guilds.get(id)
+        if guild is None:
+            guild = self.guilds[id] = ReplayGuild(id, name)
+        elif name:
+            guild.name = name
+        return guild
+
+    def decode(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        kind = value.get("~")
+        if kind == "message":
+            channel = self.decode(value["channel"])
+            author = self.decode(value["author"])
+            return ReplayMessage(value["id"], channel, author, value["content"])
+        if kind == "guild":
+            return self.get_guild(value["id"], value["name"])
+        if kind == "channel":
+            channel = self.channels.get(value["id"])
+            if channel is None:
+                guild = self.get_guild(value["guild"])
+                channel = ReplayChannel(value["id"], guild, value["name"])
+                self.channels[value["id"]] = channel
+            return channel
+        if kind == "user":
+            user = self.users.get(value["id"])
+            if user is None:
+                user = ReplayUser(value["id"], value["name"], value["bot"])
+                self.users[value["id"]] = user
+            if value.get("guild") is None:
+                return user
+            key = (value["guild"], value["id"])
+            member = self.members.get(key)
+            if member is None:
+                guild = self.get_guild(value["guild"])
+                member = self.members[key] = ReplayMember(user, guild)
+            return member
+        if kind == "datetime":
+            return datetime.datetime.fromisoformat(value["value"])
+        return None
+
+
+def iterate_lines(file: IO[str]) -> Iterator[str]:
+    try:
+        for line in file:
+            # The last line of a cut off member
+            if not line.endswith("\n"):
+                return
+            yield line
+    except (EOFError, zlib.error):
+        return
+
+
+def read(path: str) -> Iterator[tuple[float, str, list[Any], dict[str, Any]]]:
+    """Read a recording's events, as (offset, event name, args, kwargs).  The
+    offsets of every session after the first continue from the one before.
+    A member cut off mid-write (by the bot dying) ends the recording."""
+    decoder = Decoder()
+    base = 0.0
+    last = 0.0
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in iterate_lines(file):
+            entry = json.loads(line)
+            if isinstance(entry, dict):
+                if entry.get("version") != version:
+                    raise ValueError(
+                        f"Recording `{path}` has version {entry.get('version')}, "
+                        f"but only version {version} can be replayed."
+                    )
+                base = last
+                continue
+            kwargs = entry[3] if len(entry) > 3 else {}
+            last = round(base + entry[0], 4)
+            yield (
+                last,
+                entry[1],
+                decoder.decode(entry[2]),
+                {key: decoder.decode(value) for key, value in kwargs.items()},
+            )
+
+
+async def replay(
+    handler: Any, path: str, speed: Optional[float] = 1.0
+) -> dict[str, Any]:
+    """Fire a recording's events through `handler.fire_event`, at `speed` times
+    the recorded pace, or as fast as possible with `speed=None`.  Paced events
+    are fired concurrently, as the gateway would; otherwise one at a time."""
+    loop = asyncio.get_running_loop()
+    fired = 0
+    errors = 0
+    max_lag = 0.0
+    tasks: set[asyncio.Task] = set()
+
+    async def fire(event_name: str, args: list[Any], kwargs: dict) -> None:
+        nonlocal errors
+        try:
+            await handler.fire_event(event_name, *args, **kwargs)
+        except Exception:
+            errors += 1
+
+    start = loop.time()
+    for offset, event_name, args, kwargs in read(path):
+        fired += 1
+        if not speed:
+            await fire(event_name, args, kwargs)
+            continue
+        delay = start + offset / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            max_lag = max(max_lag, -delay)
+        task = loop.create_task(fire(event_name, args, kwargs))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+    return {
+        "events": fired,
+        "errors": errors,
+        "elapsed": elapsed,
+        "events_per_second": fired / elapsed if elapsed else 0.0,
+        "max_lag": max_lag,
+    }
@@ -0,0 +1,234 @@
+"""Bounded dispatch queues sitting between the event hooks and the event trees.
+Each queue has its own workers and overflow policy, so that a flood of one
+kind of event can't delay another or grow without bound.  Connection events
+skip the queues entirely and are fired as soon as they are received.
+
+`discord.py` already runs every dispatch as its own task, so with the `block`
+policy, waiting for room only suspends that task.  Past `max_waiting` waiting
+tasks, events are dropped instead, so that memory stays bounded."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+overflow_policies: tuple[str, ...] = ("block", "drop-oldest", "drop-newest")
+
+# Events that are fired inline, never waiting behind any queue.
+inline_events: tuple[str, ...] = (
+    "on_connect",
+    "on_disconnect",
+    "on_shard_connect",
+    "on_shard_disconnect",
+    "on_ready",
+    "on_resumed",
+    "on_shard_ready",
+    "on_shard_resumed",
+    "on_error",
+    "on_guild_available",
+    "on_guild_unavailable",
+    "on_interaction",
+)
+
+# Queues (by priority class) and the events routed to them.  Events not listed
+# go to the `default` queue.  Can be overridden with `dispatch_queues` in
+# `config.json`.
+default_queues: dict[str, dict[str, Any]] = {
+    "default": {
+        "max_size": 1000,
+        "workers": 4,
+        "policy": "block",
+        "max_waiting": 200,
+    },
+    # The raw edits and deletes share a queue with `on_message`, so the message
+    # cache (see `message_cache.py`) sees a message added before it changes.
+    "messages": {
+        "events": [
+            "on_message",
+            "on_message_edit",
+            "on_message_delete",
+            "on_bulk_message_delete",
+            "on_raw_message_edit",
+            "on_raw_message_delete",
+            "on_raw_bulk_message_delete",
+        ],
+        "max_size": 2000,
+        "workers": 8,
+        "policy": "drop-oldest",
+    },
+    "bulk": {
+        "events": [
+            "on_presence_update",
+            "on_typing",
+            "on_voice_state_update",
+            "on_member_update",
+            "on_user_update",
+            "on_reaction_add",
+            "on_reaction_remove",
+            "on_socket_event_type",
+        ],
+        "max_size": 500,
+        "workers": 2,
+        "policy": "drop-oldest",
+    },
+}
+
+
+class DispatchQueue:
+    """A bounded queue of events, consumed by a fixed number of workers."""
+
+    def __init__(
+        self,
+        name: str,
+        events: Optional[list[str]] = None,
+        max_size: int = 1000,
+        workers: int = 4,
+        policy: str = "block",
+        max_waiting: int = 100,
+    ) -> None:
+        if policy not in overflow_policies:
+            raise ValueError(
+                f"`{policy}` is not a valid overflow policy for queue `{name}`.  "
+                f"Valid policies: {', '.join(overflow_policies)}."
+            )
+        if max_size < 1 or workers < 1:
+            raise ValueError(f"Queue `{name}` needs a positive size and workers.")
+        self.name = name
+        self.events: list[str] = list(events or [])
+        self.max_size = max_size
+        self.workers = workers
+        self.policy = policy
+        self.max_waiting = max_waiting
+        # Dispatch tasks waiting for room, with the `block` policy
+        self.waiting: int = 0
+        # Created on start, so that they belong to the running loop.
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: list[asyncio.Task] = []
+        # Metrics
+        self.submitted: int = 0
+        self.processed: int = 0
+        self.dropped: int = 0
+        self.peak_depth: int = 0
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    @property
+    def started(self) -> bool:
+        return self.queue is not None
+
+    def start(self, consumer: Callable[..., Awaitable[None]]) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.tasks = [
+            asyncio.create_task(self.work(consumer), name=f"{self.name}_worker_{i}")
+            for i in range(self.workers)
+        ]
+
+    async def put(self, item: tuple[str, tuple[Any, ...], dict[str, Any]]) -> None:
+        queue: asyncio.Queue = self.queue  # type: ignore
+        self.submitted += 1
+        if queue.full():
+            if self.policy == "drop-newest":
+                self.dropped += 1
+                return
+            if self.policy == "drop-oldest":
+                queue.get_nowait()
+                queue.task_done()
+                self.dropped += 1
+            elif self.waiting >= self.max_waiting:
+                self.dropped += 1
+                return
+        # Only waits with the `block` policy.
+        self.waiting += 1
+        try:
+            await queue.put(item)
+        finally:
+            self.waiting -= 1
+        self.peak_depth = max(self.peak_depth, queue.qsize())
+
+    async def work(self, consumer: Callable[..., Awaitable[None]]) -> None:
+        queue: asyncio.Queue = self.queue  # type: ignore
+        while True:
+            event_name, args, kwargs = await queue.get()
+            try:
+                await consumer(event_name, *args, **kwargs)
+            finally:
+                queue.task_done()
+                self.processed += 1
+
+    def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.queue = None
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "waiting": self.waiting,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+
+
+class Scheduler:
+    """Routes fired events to their dispatch queue, or fires them inline."""
+
+    def __init__(
+        self,
+        fire: Callable[..., Awaitable[None]],
+        on_error: Callable[..., Awaitable[None]],
+        queues: Optional[dict[str, dict[str, Any]]] = None,
+        inline: tuple[str, ...] = inline_events,
+    ) -> None:
+        self.fire = fire
+        self.on_error = on_error
+        self.inline: frozenset[str] = frozenset(inline)
+        config = {name: dict(options) for name, options in default_queues.items()}
+        for name, options in (queues or {}).items():
+            config.setdefault(name, {}).update(options)
+        self.queues: dict[str, DispatchQueue] = {
+            name: DispatchQueue(name, **options) for name, options in config.items()
+        }
+        if "default" not in self.queues:
+            raise ValueError("The scheduler needs a `default` queue.")
+        self.default = self.queues["default"]
+        self.routes: dict[str, DispatchQueue] = {}
+        for queue in self.queues.values():
+            for event_name in queue.events:
+                self.routes[event_name] = queue
+
+    async def submit(self, event_name: str, *args: Any, **kwargs: Any) -> None:
+        if event_name in self.inline:
+            await self.fire(event_name, *args, **kwargs)
+            return
+        queue = self.routes.get(event_name, self.default)
+        if not queue.started:
+            queue.start(self.consume)
+        await queue.put((event_name, args, kwargs))
+
+    async def consume(self, event_name: str, *args: Any, **kwargs: Any) -> None:
+        # Mirrors `discord.Client._run_event`, as the error would otherwise be
+        # lost inside the worker.
+        try:
+            await self.fire(event_name, *args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            try:
+                await self.on_error(event_name, *args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    def stop(self) -> None:
+        for queue in self.queues.values():
+            queue.stop()
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        return {name: queue.metrics() for name, queue in self.queues.items()}
@@ -0,0 +1,161 @@
+"""A cache of per-guild settings in front of the data interface, as settings
+are read on almost every event.  Entries expire after a TTL, the least
+recently used are evicted past `max_size`, guilds without settings are cached
+too, and concurrent misses for a guild share a single load.  Cached settings
+are dropped when their guild (or its roles) change, or the bot leaves it."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from Feynbot.data_interface import Interface
+from Feynbot.events import EventTree
+
+# Cached for guilds without any settings stored
+missing: Any = object()
+
+
+class SettingsCache:
+    """Per-guild settings, read through the data interface."""
+
+    def __init__(
+        self,
+        db: Interface,
+        collection: str = "guild_settings",
+        defaults: Optional[dict[str, Any]] = None,
+        max_size: int = 10000,
+        ttl: float = 300.0,
+        negative_ttl: float = 60.0,
+    ) -> None:
+        self.db = db
+        self.collection = collection
+        self.defaults: dict[str, Any] = defaults or {}
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # Guild ID -> (expiry, settings or `missing`), least recently used first
+        self.entries: OrderedDict[int, tuple[float, Any]] = OrderedDict()
+        self.loading: dict[int, asyncio.Task] = {}
+        # Metrics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.negative_hits: int = 0
+        self.evictions: int = 0
+        self.expirations: int = 0
+        self.invalidations: int = 0
+        self.loads: int = 0
+        self.load_time: float = 0.0
+        self.max_load_time: float = 0.0
+
+        # Invalidation, before any other listener can read stale settings
+        self.tree = EventTree("Settings", persistent=True, priority=100)
+        bind = self.tree.bind
+        bind("on_guild_update", "InvalidateUpdatedGuild")(self.on_guild_change)
+        bind("on_guild_role_update", "InvalidateUpdatedRoles")(self.on_guild_change)
+        bind("on_guild_remove", "InvalidateRemovedGuild")(self.on_guild_change)
+
+    def on_guild_change(self, guild) -> None:
+        if guild is not None:
+            self.invalidate(guild.id)
+
+    async def get(self, gid: Optional[int]) -> dict[str, Any]:
+        """Get a guild's settings, over the defaults.  Don't modify them, as
+        they are shared until they expire; use `set` instead."""
+        if gid is None:
+            return self.defaults
+        entry = self.entries.get(gid)
+        if entry is not None:
+            expiry, settings = entry
+            if expiry > time.monotonic():
+                self.entries.move_to_end(gid)
+                self.hits += 1
+                if settings is missing:
+                    self.negative_hits += 1
+                    return self.defaults
+                return settings
+            del self.entries[gid]
+            self.expirations += 1
+        self.misses += 1
+        task = self.loading.get(gid)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self.load(gid))
+            self.loading[gid] = task
+            task.add_done_callback(lambda task, gid=gid: self.finish_load(gid, task))
+        # A caller giving up mustn't cancel the load for everyone else.
+        settings = await asyncio.shield(task)
+        return self.defaults if settings is missing else settings
+
+    def peek(self, gid: Optional[int]) -> Optional[dict[str, Any]]:
+        """Get a guild's settings only if they're cached, without loading them
+        (or counting a hit or miss)."""
+        if gid is None:
+            return self.defaults
+        entry = self.entries.get(gid)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        self.entries.move_to_end(gid)
+        return self.defaults if entry[1] is missing else entry[1]
+
+    async def load(self, gid: int) -> Any:
+        start = time.perf_counter()
+        document = await self.db.get(self.collection, gid)
+        elapsed = time.perf_counter() - start
+        self.loads += 1
+        self.load_time += elapsed
+        self.max_load_time = max(self.max_load_time, elapsed)
+        if document is None:
+            settings = missing
+            ttl = self.negative_ttl
+        else:
+            document.pop("_id", None)
+            settings = {**self.defaults, **document}
+            ttl = self.ttl
+        # Not kept if invalidated while loading, as it may be stale.
+        if self.loading.get(gid) is asyncio.current_task():
+            self.store(gid, settings, ttl)
+        return settings
+
+    def finish_load(self, gid: int, task: asyncio.Task) -> None:
+        if self.loading.get(gid) is task:
+            del self.loading[gid]
+
+    def store(self, gid: int, settings: Any, ttl: float) -> None:
+        self.entries[gid] = (time.monotonic() + ttl, settings)
+        self.entries.move_to_end(gid)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def set(self, gid: int, **settings: Any) -> None:
+        """Store some of a guild's settings."""
+        await self.db.update(self.collection, gid, settings)
+        self.invalidate(gid)
+
+    def invalidate(self, gid: Optional[int] = None) -> None:
+        """Drop a guild's cached settings, or every guild's."""
+        self.invalidations += 1
+        if gid is None:
+            self.entries.clear()
+            self.loading.clear()
+            return
+        self.entries.pop(gid, None)
+        self.loading.pop(gid, None)
+
+    def metrics(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "loading": len(self.loading),
+            "loads": self.loads,
+            "mean_load_time": self.load_time / self.loads if self.loads else 0.0,
+            "max_load_time": self.max_load_time,
+        }
@@ -1,8 +1,10 @@
 """Collection of non-specific functions and classes."""
 
 import sys
+import hashlib
 import pathlib
 import importlib.util
+from inspect import currentframe
 from types import ModuleType
 from typing import Any, Optional
 
@@ -15,6 +17,28 @@ def check_kwargs(kwargs: dict[str, Any]) -> None:
         raise InvalidKwarg(keys)
 
 
+def pop_origin(kwargs: dict[str, Any]) -> tuple[str, str]:
+    """Pop `origin` and `file_path` from `kwargs`, defaulting to the module the
+    calling function was called from."""
+    if "origin" in kwargs and "file_path" in kwargs:
+        return kwargs.pop("origin"), kwargs.pop("file_path")
+    # Get file info from where this was defined
+    caller_variables = currentframe().f_back.f_back.f_globals  # type: ignore
+    origin = kwargs.pop("origin", caller_variables["__name__"])
+    file_path = kwargs.pop("file_path", caller_variables["__file__"])
+    return origin, file_path
+
+
+def get_module_name(path: pathlib.Path) -> str:
+    filename = path.name
+    parent = path.resolve().parent.name
+    if not filename.endswith(".py"):
+        raise ImportError(
+            f"Tried to import {path}, but got non-Python file {filename}!"
+        )
+    return parent + "." + filename[:-3]
+
+
 def import_from_path(
     path_string: str,
     path: Optional[pathlib.Path] = None,
@@ -22,22 +46,19 @@ def import_from_path(
 ) -> ModuleType:
     path = pathlib.Path(path_string).resolve()
     if not name:
-        filename = path.name
-        parent = path.parent.name
-        if filename.endswith(".py"):
-            name = parent + "." + filename[:-3]
-        else:
-            raise ImportError(
-                f"Tried to import {path}, but got non-Python file {filename}!"
-            )
+        name = get_module_name(path)
     premodule = importlib.util.spec_from_file_location(name, path)
     if not premodule:
         raise ImportError(f"Tried importing {path}, but failed!")
     module = importlib.util.module_from_spec(premodule)
-    sys.modules["module.name"] = module
+    sys.modules[name] = module
     if not (isinstance(module, ModuleType)):
         raise ImportError(f"Tried importing {path}, but failed!")
     if not premodule.loader:
         raise ImportError(f"Tried importing {path}, but failed!")
     premodule.loader.exec_module(module)
     return module
+
+
+def file_digest(path: pathlib.Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
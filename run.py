@@ -2,8 +2,8 @@
 
 import pyjson5 as json
 
-from Feynbot.bot import Feynbot
-
+from Feynbot.bot import Feynbot, ShardedFeynbot
+from Feynbot.cluster import launch
 
 # Load configuration
 with open("config.json", encoding="utf-8") as file:
@@ -12,8 +12,14 @@ with open("config.json", encoding="utf-8") as file:
 with open("intents.json", encoding="utf-8") as file:
     config["intents"] = json.load(file)["intents"]
 
-bot = Feynbot(**config)
-
-
-# IMPLEMENT: Fatal Error handling
-bot.run()
+# Guarded, as every cluster's process imports this module.
+if __name__ == "__main__":
+    # IMPLEMENT: Fatal Error handling
+    clusters = config.pop("clusters", None)
+    if clusters:
+        # A process per cluster, each with a range of shards (see `cluster.py`)
+        launch(config, clusters, shard_count=config.pop("shard_count", None))
+    elif config.pop("sharded", False):
+        ShardedFeynbot(**config).run()
+    else:
+        Feynbot(**config).run()